@@ -1,15 +1,29 @@
+import os
+import json
+import multiprocessing
 import regex
-import joblib
+import warnings
 
+from hashlib import blake2b
 from tqdm import tqdm
-from itertools import groupby
-from more_itertools import flatten
+from operator import attrgetter
+from itertools import chain, groupby
+from concurrent.futures import ProcessPoolExecutor
 from pypdf import PdfReader, PageObject
 
-from typing import Literal
+from typing import Iterable, Iterator, Literal
 from pydantic import BaseModel, NonNegativeInt, PositiveInt, StrictStr, Field
 
 
+_LOCATION_RE = regex.compile(
+    r"([AB]?\d+\s{2,})(.*?)(\s{2,}[AB]?\d+$)", regex.ASCII
+)
+_MIN_INDENT = 2
+# Bump whenever a parsing change alters the documents produced by load().
+_CACHE_VERSION = 1
+_PAREN_RE = regex.compile(r"\(.*\)")
+
+
 class LineItem(BaseModel):
     page_number: NonNegativeInt
     text_type: Literal[
@@ -27,6 +41,29 @@ class Document(BaseModel):
     metadata: dict
 
 
+_worker_loader: "MatrixScriptLoader | None" = None
+_worker_reader: PdfReader | None = None
+
+
+def _init_page_worker(loader: "MatrixScriptLoader") -> None:
+    global _worker_loader, _worker_reader
+
+    _worker_loader = loader
+    _worker_reader = PdfReader(loader.source_path)
+
+
+def _get_mp_context() -> multiprocessing.context.BaseContext:
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+
+    return multiprocessing.get_context("spawn")
+
+
+def _parse_page_index(page_index: int) -> list[LineItem]:
+    assert _worker_loader is not None and _worker_reader is not None
+    return list(_worker_loader.parse_page(_worker_reader.pages[page_index]))
+
+
 class MatrixScriptLoader:
     def __init__(
         self,
@@ -48,19 +85,36 @@ class MatrixScriptLoader:
         start_page: int | None = 1,
         end_page: int | None = None,
         show_no_matched_texts: bool = False,
+        max_workers: int | None = 1,
+        page_chunksize: int = 4,
+        cache_dir: str | None = None,
+        verbose: bool = False,
     ):
         super().__init__()
 
         self.source_path = source_path
         self.ignoread_tags = ignoread_tags
+        self._ignoread_tags_re = (
+            regex.compile("|".join(regex.escape(it) for it in ignoread_tags))
+            if ignoread_tags
+            else None
+        )
         self.location_margins = location_margins
         self.description_margins = description_margins
         self.dialog_margins = dialog_margins
         self.character_margins = character_margins
+        # Description margins take precedence when they overlap dialog margins.
+        self._indented_text_types = {
+            margin: "dialog" for margin in dialog_margins
+        } | {margin: "description" for margin in description_margins}
 
         self.start_page = start_page
         self.end_page = end_page
         self.show_no_matched_texts = show_no_matched_texts
+        self.max_workers = max_workers
+        self.page_chunksize = page_chunksize
+        self.cache_dir = cache_dir
+        self.verbose = verbose
 
     def _get_location_text(
         self,
@@ -69,9 +123,7 @@ class MatrixScriptLoader:
         if not line_text.isupper():
             return None, None
 
-        match_ = regex.match(
-            r"([AB]?\d+\s{2,})(.*?)(\s{2,}[AB]?\d+$)", line_text
-        )
+        match_ = _LOCATION_RE.match(line_text)
 
         if match_ is None:
             return None, None
@@ -84,118 +136,51 @@ class MatrixScriptLoader:
 
         return groups[1].strip(), margin
 
-    def _get_character_text(
-        self,
-        line_text: str,
-    ) -> tuple[str | None, int | None]:
-        if not line_text.isupper():
-            return None, None
-
-        if not line_text.endswith(""):
-            return None, None
-
-        match_ = regex.match(r"(\s{2,})(.*)", line_text)
-        if match_ is None:
-            return None, None
-
-        groups = match_.groups()
-        margin = len(groups[0])
-
-        if margin not in self.character_margins:
-            return None, None
-
-        character_text = groups[1]
-        character_text = regex.sub(r"\(.*\)", "", character_text)
-        character_text = character_text.strip()
-
-        return character_text, margin
-
-    def _get_non_upper_text(
-        self,
-        line_text: str,
-        margins: set[int],
-    ) -> tuple[str, int] | tuple[None, None]:
-        match_ = regex.match(r"(\s{2,})(.*)", line_text)
-        if match_ is None:
-            return None, None
-
-        groups = match_.groups()
-        margin = len(groups[0])
-        if margin not in margins:
-            return None, None
-
-        return groups[1].strip(), margin
-
-    def _get_description_text(
-        self,
-        line_text: str,
-    ) -> tuple[str, int] | tuple[None, None]:
-        return self._get_non_upper_text(
-            line_text,
-            margins=self.description_margins,
-        )
-
-    def _get_dialog_text(
-        self,
-        line_text: str,
-    ) -> tuple[str, int] | tuple[None, None]:
-        return self._get_non_upper_text(
-            line_text,
-            margins=self.dialog_margins,
-        )
-
     def _parse_page_line(
         self,
         line_text: str,
         page_number: int,
     ) -> LineItem | None:
-        if any(it in line_text for it in self.ignoread_tags):
+        if (
+            self._ignoread_tags_re is not None
+            and self._ignoread_tags_re.search(line_text) is not None
+        ):
             return
 
-        location_text, location_margin = self._get_location_text(
-            line_text=line_text
-        )
-
-        if location_text is not None and location_margin is not None:
-            return LineItem(
-                page_number=page_number,
-                text_type="location",
-                text=location_text,
-                margin=location_margin,
-            )
-
-        character_text, character_margin = self._get_character_text(
-            line_text=line_text
-        )
+        # Location lines start with a scene number, every other text type is
+        # indented, so the width of the indent decides which branch applies.
+        body_text = line_text.lstrip()
+        margin = len(line_text) - len(body_text)
 
-        if character_text is not None and character_margin is not None:
-            return LineItem(
-                page_number=page_number,
-                text_type="character",
-                text=character_text,
-                margin=character_margin,
+        if margin < _MIN_INDENT:
+            location_text, location_margin = self._get_location_text(
+                line_text=line_text
             )
 
-        description_text, description_margin = self._get_description_text(
-            line_text=line_text
-        )
-
-        if description_text is not None and description_margin is not None:
-            return LineItem(
-                page_number=page_number,
-                text_type="description",
-                text=description_text,
-                margin=description_margin,
-            )
+            if location_text is not None and location_margin is not None:
+                return LineItem(
+                    page_number=page_number,
+                    text_type="location",
+                    text=location_text,
+                    margin=location_margin,
+                )
+        else:
+            if margin in self.character_margins and line_text.isupper():
+                return LineItem(
+                    page_number=page_number,
+                    text_type="character",
+                    text=_PAREN_RE.sub("", body_text).strip(),
+                    margin=margin,
+                )
 
-        dialog_text, dialog_margin = self._get_dialog_text(line_text=line_text)
-        if dialog_text is not None and dialog_margin is not None:
-            return LineItem(
-                page_number=page_number,
-                text_type="dialog",
-                text=dialog_text,
-                margin=dialog_margin,
-            )
+            text_type = self._indented_text_types.get(margin)
+            if text_type is not None:
+                return LineItem(
+                    page_number=page_number,
+                    text_type=text_type,
+                    text=body_text.rstrip(),
+                    margin=margin,
+                )
 
         if self.show_no_matched_texts:
             no_matched_text = line_text.strip()
@@ -207,28 +192,19 @@ class MatrixScriptLoader:
 
                 print(f"no matched text: {show_item}")
 
-    def parse_page(self, page: PageObject) -> list[LineItem]:
+    def parse_page(self, page: PageObject) -> Iterator[LineItem]:
         assert page.page_number is not None
-        if self.start_page is not None:
-            if page.page_number < self.start_page:
-                return []
-
-        if self.end_page is not None:
-            if page.page_number > self.end_page:
-                return []
-
         page_number = page.page_number
         page_text = page.extract_text(extraction_mode="layout")
 
-        line_items = (
-            self._parse_page_line(
+        for line_text in page_text.split("\n"):
+            line_item = self._parse_page_line(
                 line_text=line_text,
                 page_number=page_number,
             )
-            for line_text in page_text.split("\n")
-        )
 
-        return [li for li in line_items if li is not None]
+            if line_item is not None:
+                yield line_item
 
     def _agg_line_groups(self, line_group: list[LineItem]) -> LineItem:
         if len(line_group) == 1:
@@ -247,21 +223,114 @@ class MatrixScriptLoader:
             margin=line_group[0].margin,
         )
 
+    def _get_page_indexes(self, reader: PdfReader) -> range:
+        start_index = self.start_page if self.start_page is not None else 0
+        end_index = reader.get_num_pages() - 1
+        if self.end_page is not None:
+            end_index = min(end_index, self.end_page)
+
+        return range(max(start_index, 0), end_index + 1)
+
+    def _parse_pages(self, reader: PdfReader) -> Iterator[Iterable[LineItem]]:
+        page_indexes = self._get_page_indexes(reader)
+        num_pages = len(page_indexes)
+
+        max_workers = min(self.max_workers or os.cpu_count() or 1, num_pages)
+        if max_workers <= 1:
+            pages = (reader.pages[page_index] for page_index in page_indexes)
+            yield from map(self.parse_page, self._progress(pages, num_pages))
+            return
+
+        # Text extraction dominates the cost of a page, so every worker opens
+        # its own reader and both extracts and parses the pages it is given.
+        # Workers never fork the caller, which may be running other threads.
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=_get_mp_context(),
+            initializer=_init_page_worker,
+            initargs=(self,),
+        ) as executor:
+            yield from self._progress(
+                executor.map(
+                    _parse_page_index,
+                    page_indexes,
+                    chunksize=self.page_chunksize,
+                ),
+                num_pages,
+            )
+
+    def _progress(self, items: Iterable, total: int) -> Iterable:
+        if not self.verbose:
+            return items
+
+        return tqdm(items, total=total)
+
+    def _get_cache_path(self) -> str:
+        assert self.cache_dir
+        source_stat = os.stat(self.source_path)
+        cache_key = json.dumps(
+            [
+                _CACHE_VERSION,
+                os.path.abspath(self.source_path),
+                source_stat.st_mtime_ns,
+                source_stat.st_size,
+                self.ignoread_tags,
+                sorted(self.location_margins),
+                sorted(self.description_margins),
+                sorted(self.dialog_margins),
+                sorted(self.character_margins),
+                self.start_page,
+                self.end_page,
+            ]
+        )
+        cache_name = blake2b(cache_key.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, f"{cache_name}.json")
+
+    def _read_cache(self, cache_path: str) -> list[Document]:
+        with open(cache_path, encoding="utf-8") as cache_file:
+            return [
+                Document(text=text, metadata=metadata)
+                for text, metadata in json.load(cache_file)
+            ]
+
+    def _write_cache(self, cache_path: str, documents: list[Document]) -> None:
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as cache_file:
+                json.dump([(d.text, d.metadata) for d in documents], cache_file)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            warnings.warn(f"could not write loader cache {cache_path}: {e}")
+
     def load(self) -> list[Document]:
+        if not self.cache_dir:
+            return self._load()
+
+        cache_path = self._get_cache_path()
+        if os.path.exists(cache_path):
+            try:
+                return self._read_cache(cache_path)
+            except (OSError, ValueError, TypeError) as e:
+                # Rebuild below, overwriting the unusable cache file.
+                warnings.warn(f"could not read loader cache {cache_path}: {e}")
+
+        documents = self._load()
+        self._write_cache(cache_path, documents)
+
+        return documents
+
+    def _load(self) -> list[Document]:
         reader = PdfReader(self.source_path)
-        parsed_pages = map(
-            self.parse_page,
-            tqdm(
-                reader.pages,
-                total=reader.get_num_pages(),
-            ),
-        )
+        parsed_pages = self._parse_pages(reader)
 
-        line_items = list(flatten(parsed_pages))
-        line_groups = groupby(line_items, key=lambda x: (x.text_type, x.margin))
-        line_items = [
+        line_groups = groupby(
+            chain.from_iterable(parsed_pages),
+            key=attrgetter("text_type", "margin"),
+        )
+        line_items = (
             self._agg_line_groups(line_group=list(lg[1])) for lg in line_groups
-        ]
+        )
 
         location = None
         scene_description_id = None
@@ -280,7 +349,9 @@ class MatrixScriptLoader:
                 continue
 
             if text_type == "description":
-                scene_description_id = joblib.hash(text)
+                scene_description_id = blake2b(
+                    text.encode("utf-8"), digest_size=16
+                ).hexdigest()
                 documents.append(
                     Document(
                         text=text,
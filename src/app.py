@@ -1,5 +1,15 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .routers.agent_router import router as agent_router
+from .routers.agent_router import router as agent_router, init_rag_service, get_settings
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the RAG service, index data and warm up connections before serving requests"""
+    rag_service = await init_rag_service(get_settings())
+    await rag_service.warm_up()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(agent_router)
@@ -13,21 +13,32 @@ class Settings(BaseSettings):
     embedding_dims: int = 256
     use_memory: bool = True
     qdrant_use_memory: bool = True
+    # Persist the local (non-server) Qdrant store here instead of keeping it in memory
+    qdrant_path: str | None = None
     qdrant_host: str = "localhost"
     qdrant_port: int = 6333
+    qdrant_grpc_port: int = 6334
+    # Talk to a remote Qdrant over gRPC, which has far less per-request overhead than REST
+    qdrant_prefer_grpc: bool = True
+    # Quantize stored vectors: "scalar" (int8), "binary" or None to keep full float32 vectors
+    qdrant_quantization: str | None = None
+    # HNSW candidate list size at query time, lower trades recall for latency (None for the server default)
+    qdrant_hnsw_ef: int | None = 64
+    # Only search indexed segments; a collection below the indexing threshold then returns nothing
+    qdrant_indexed_only: bool = False
+    # HNSW graph built for new collections; 0 indexing threads lets the server match its own CPUs
+    qdrant_hnsw_m: int = 32
+    qdrant_hnsw_ef_construct: int = 256
+    qdrant_max_indexing_threads: int = 0
+    loader_cache_dir: str | None = os.path.expanduser("~/.cache/kbac")
+    # Processes parsing script pages on a cold loader cache; 1 parses in-process, None uses one per CPU
+    loader_max_workers: int | None = 1
+    embedding_cache_path: str | None = os.path.expanduser("~/.cache/kbac/embeddings.sqlite3")
 
     model_config = SettingsConfigDict(
         env_file=os.path.join(BASE_DIR, ".env"),
         env_file_encoding='utf-8',
         case_sensitive=False
     )
-    
-    def __hash__(self):
-        return id(self)
-    
-    def __eq__(self, other):
-        if not isinstance(other, Settings):
-            return False
-        return id(self) == id(other)
 
 settings = Settings()
@@ -1,12 +1,17 @@
+import asyncio
+import json
 import logging
+import threading
 from functools import lru_cache
+from typing import AsyncIterator
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 
 from src.config.settings import settings
 from src.schemas.models import MatrixQuery
 
 from ..services.implementations.matrix_document_loader_service import MatrixDocumentLoaderService
-from ..services.implementations.qdrant_retriever_service import QdrantRetrieverService
+from ..services.implementations.qdrant_retriever_service import QdrantRetrieverService, create_qdrant_clients
 from ..services.implementations.matrix_generator_service import MatrixGeneratorService
 from ..services.rag_service import RAGService
 
@@ -24,33 +29,101 @@ def get_settings():
 
 
 @lru_cache(maxsize=1)
+def get_qdrant_clients():
+    """Dependency for the Qdrant clients, opened once and reused for the life of the process"""
+    logger.info("Connecting to Qdrant...")
+    return create_qdrant_clients(get_settings())
+
+
+_rag_service: RAGService | None = None
+_rag_service_lock = threading.Lock()
+
+
 def get_rag_service(config = Depends(get_settings)):
-    """Initialize RAG service and index data"""
+    """Initialize RAG service and index data once per process"""
+    global _rag_service
+
+    if _rag_service is not None:
+        return _rag_service
+
+    with _rag_service_lock:
+        if _rag_service is None:
+            _rag_service = _build_rag_service(config)
+
+    return _rag_service
+
+
+async def init_rag_service(config) -> RAGService:
+    """Initialize RAG service and index data without blocking the event loop"""
+    global _rag_service
+
+    if _rag_service is not None:
+        return _rag_service
+
+    rag_service = await asyncio.to_thread(_create_rag_service, config)
+    await rag_service.aindex()
+    logger.info("RAG service initialized and documents indexed")
+
+    with _rag_service_lock:
+        if _rag_service is None:
+            _rag_service = rag_service
+
+    return _rag_service
+
+
+def _build_rag_service(config) -> RAGService:
+    """Build the RAG service and index data"""
+    rag_service = _create_rag_service(config)
+    
+    rag_service.index()
+    logger.info("RAG service initialized and documents indexed")
+    
+    return rag_service
+
+
+def _create_rag_service(config) -> RAGService:
+    """Build the RAG service without indexing data"""
     logger.info("Initializing RAG service...")
     
-    loader_service = MatrixDocumentLoaderService()
-    retriever_service = QdrantRetrieverService(config)
-    generator_service = MatrixGeneratorService()
+    loader_service = MatrixDocumentLoaderService(
+        cache_dir=config.loader_cache_dir,
+        max_workers=config.loader_max_workers
+    )
+    retriever_service = QdrantRetrieverService(config, *get_qdrant_clients())
+    generator_service = MatrixGeneratorService(
+        retriever=retriever_service,
+        subquery_top_k=config.rag_top_k
+    )
     
-    rag_service = RAGService(
+    return RAGService(
         loader=loader_service,
         retriever=retriever_service,
-        generator=generator_service
+        generator=generator_service,
+        similarity_cache_size=256
     )
-    
-    rag_service.index()
-    logger.info("RAG service initialized and documents indexed")
-    
-    return rag_service
 
 
 @router.post("/query")
 async def matrix_query(
     matrix_query: MatrixQuery,
+    stream: bool = False,
     config = Depends(get_settings),
     rag_service: RAGService = Depends(get_rag_service)
     ):
     """Endpoint to handle queries to the RAG system"""
+    if stream:
+        # Server-sent events carrying the answer text as it is generated
+        chunks = rag_service.query_stream(
+                question=matrix_query.query,
+                top_k=config.rag_top_k)
+        try:
+            # Retrieval happens before the first chunk, so its failures can still become a 500
+            first_chunk = await anext(chunks, None)
+        except Exception as e:
+            logger.error(f"Error processing query: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        return StreamingResponse(_to_event_stream(first_chunk, chunks), media_type="text/event-stream")
+
     try:
         result = await rag_service.query(
                 question=matrix_query.query,
@@ -60,3 +133,17 @@ async def matrix_query(
     except Exception as e:
         logger.error(f"Error processing query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _to_event_stream(first_chunk: str | None, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Format answer chunks as server-sent events, ending with an error event if the stream fails"""
+    try:
+        if first_chunk is not None:
+            yield f"data: {json.dumps(first_chunk)}\n\n"
+        async for chunk in chunks:
+            yield f"data: {json.dumps(chunk)}\n\n"
+    except Exception as e:
+        logger.error(f"Error streaming query: {e}")
+        yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+    finally:
+        await chunks.aclose()
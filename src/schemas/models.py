@@ -18,6 +18,32 @@ class Document(BaseModel):
         return f"Document(id={self.id}, page_content={self.page_content[:100]}...)"
 
 
+class DocumentBatch(BaseModel):
+    """Documents stored column-wise, the way indexing consumes them"""
+    ids: List[str]
+    texts: List[str]
+    metadatas: List[Dict[str, Any]]
+    
+    @classmethod
+    def from_documents(cls, documents: List[Document]) -> "DocumentBatch":
+        """Split already validated documents into columns"""
+        return cls.model_construct(
+            ids=[doc.id for doc in documents],
+            texts=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents]
+        )
+    
+    def slice(self, start: int, stop: int) -> "DocumentBatch":
+        return DocumentBatch.model_construct(
+            ids=self.ids[start:stop],
+            texts=self.texts[start:stop],
+            metadatas=self.metadatas[start:stop]
+        )
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
 class RetrievalResult(BaseModel):
     """Result from retrieval with scoring information"""
     document: Document
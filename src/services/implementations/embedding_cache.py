@@ -0,0 +1,72 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from array import array
+from contextlib import closing
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stay below SQLite's limit on host parameters per statement
+_MAX_LOOKUP_PARAMS = 500
+
+
+class EmbeddingCache:
+    """SQLite-backed store of document embeddings keyed by a hash of their text"""
+
+    def __init__(self, path: str, namespace: str):
+        # The namespace identifies the embedding model and dimensions the vectors came from
+        self.path = path
+        self.namespace = namespace
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with closing(sqlite3.connect(self.path)) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "namespace TEXT NOT NULL, text_hash BLOB NOT NULL, vector BLOB NOT NULL, "
+                    "PRIMARY KEY (namespace, text_hash))"
+                )
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Could not open embedding cache {path}: {e}")
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up cached vectors, returning None for every text not cached yet"""
+        text_hashes = [self._hash(text) for text in texts]
+        vectors_by_hash = {}
+
+        try:
+            with closing(sqlite3.connect(self.path)) as conn:
+                for start in range(0, len(text_hashes), _MAX_LOOKUP_PARAMS):
+                    chunk = text_hashes[start:start + _MAX_LOOKUP_PARAMS]
+                    rows = conn.execute(
+                        "SELECT text_hash, vector FROM embeddings "
+                        f"WHERE namespace = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                        [self.namespace, *chunk]
+                    )
+                    vectors_by_hash.update(rows)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read embedding cache {self.path}: {e}")
+
+        return [
+            array("f", vectors_by_hash[text_hash]).tolist() if text_hash in vectors_by_hash else None
+            for text_hash in text_hashes
+        ]
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]) -> None:
+        """Store the vectors of the given texts"""
+        try:
+            with closing(sqlite3.connect(self.path)) as conn, conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (namespace, text_hash, vector) VALUES (?, ?, ?)",
+                    [
+                        (self.namespace, self._hash(text), array("f", vector).tobytes())
+                        for text, vector in zip(texts, vectors)
+                    ]
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not write embedding cache {self.path}: {e}")
+
+    def _hash(self, text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
@@ -7,6 +7,14 @@ from src.schemas.models import Document
 from src.config.settings import BASE_DIR
 from ..interfaces.document_loader_service import DocumentLoaderService
 
+_SENTENCE_BOUNDARY_RE = re.compile(r'[.!?]\s+', re.ASCII)
+_TEXT_TYPE_BITS = {
+    'dialog': 1,
+    'scene_description': 2,
+    'location': 4,
+    'character': 8,
+}
+
 
 class MatrixDocumentLoaderService(DocumentLoaderService):
     """Enhanced Matrix script loader with intelligent chunking"""
@@ -15,7 +23,9 @@ class MatrixDocumentLoaderService(DocumentLoaderService):
         self, 
         script_path: Optional[str] = None,
         chunk_size: int = 1000,
-        overlap: int = 200
+        overlap: int = 200,
+        cache_dir: Optional[str] = None,
+        max_workers: Optional[int] = 1
     ):
         if script_path is None:
             script_path = os.path.join(
@@ -26,7 +36,15 @@ class MatrixDocumentLoaderService(DocumentLoaderService):
         self.script_path = script_path
         self.chunk_size = chunk_size
         self.overlap = overlap
-        self.loader = MatrixScriptLoader(source_path=self.script_path)
+        self._content_formatters = {
+            'dialog': lambda doc: f"{doc.metadata.get('character', 'UNKNOWN')}: {doc.text}",
+            'scene_description': lambda doc: f"[SCENE] {doc.text}",
+        }
+        self.loader = MatrixScriptLoader(
+            source_path=self.script_path,
+            cache_dir=cache_dir,
+            max_workers=max_workers
+        )
 
     def load_documents(self) -> List[Document]:
         """Load and chunk Matrix script documents"""
@@ -34,10 +52,13 @@ class MatrixDocumentLoaderService(DocumentLoaderService):
         
         chunks = self._create_intelligent_chunks(base_documents)
         
+        # Draw the random bytes for every chunk id with a single call
+        random_bytes = os.urandom(16 * len(chunks))
+        
         documents = []
         for i, chunk in enumerate(chunks):
             doc = Document(
-                id=str(uuid.uuid4()),
+                id=str(uuid.UUID(bytes=random_bytes[i * 16:(i + 1) * 16], version=4)),
                 page_content=chunk['content'],
                 metadata={
                     **chunk['metadata'],
@@ -51,76 +72,76 @@ class MatrixDocumentLoaderService(DocumentLoaderService):
     def _create_intelligent_chunks(self, raw_documents: List[BaseDocument]) -> List[Dict[str, Any]]:
         """Create intelligent chunks preserving context"""
         chunks = []
-        current_chunk = {
-            'content': '',
-            'metadata': {
-                'scenes': set(),
-                'characters': set(),
-                'text_types': set(),
-                'page_numbers': set()
-            }
-        }
+        current_chunk = self._new_chunk('')
         
         for doc in raw_documents:
             doc_text = doc.text
             doc_metadata = doc.metadata
             
             # Check if adding this document would exceed chunk size
-            if (len(current_chunk['content']) + len(doc_text) > self.chunk_size and 
-                len(current_chunk['content']) > 0):
+            if (current_chunk['length'] + len(doc_text) > self.chunk_size and 
+                current_chunk['length'] > 0):
                 
                 # Finalize current chunk
-                chunks.append(self._finalize_chunk(current_chunk))
+                finalized_chunk = self._finalize_chunk(current_chunk)
+                chunks.append(finalized_chunk)
                 
                 # Start new chunk with overlap
-                overlap_text = self._get_overlap_text(current_chunk['content'])
-                current_chunk = {
-                    'content': overlap_text,
-                    'metadata': {
-                        'scenes': set(),
-                        'characters': set(),
-                        'text_types': set(),
-                        'page_numbers': set()
-                    }
-                }
+                overlap_text = self._get_overlap_text(finalized_chunk['content'])
+                current_chunk = self._new_chunk(overlap_text)
             
             # Add document to current chunk
-            if current_chunk['content']:
-                current_chunk['content'] += '\n\n'
+            if current_chunk['length']:
+                current_chunk['content'].append('\n\n')
+                current_chunk['length'] += 2
             
             # Format content with context
             formatted_content = self._format_document_content(doc)
-            current_chunk['content'] += formatted_content
+            current_chunk['content'].append(formatted_content)
+            current_chunk['length'] += len(formatted_content)
             
             # Update metadata
             if doc_metadata.get('location'):
                 current_chunk['metadata']['scenes'].add(doc_metadata['location'])
             if doc_metadata.get('character'):
                 current_chunk['metadata']['characters'].add(doc_metadata['character'])
-            if doc_metadata.get('text_type'):
-                current_chunk['metadata']['text_types'].add(doc_metadata['text_type'])
+            text_type = doc_metadata.get('text_type')
+            if text_type in _TEXT_TYPE_BITS:
+                current_chunk['metadata']['text_types_mask'] |= _TEXT_TYPE_BITS[text_type]
+            elif text_type:
+                current_chunk['metadata']['other_text_types'].add(text_type)
             if doc_metadata.get('page_number'):
-                current_chunk['metadata']['page_numbers'].add(doc_metadata['page_number'])
+                current_chunk['metadata']['page_numbers_mask'] |= 1 << doc_metadata['page_number']
         
         # Add final chunk if not empty
-        if current_chunk['content'].strip():
-            chunks.append(self._finalize_chunk(current_chunk))
+        if current_chunk['length']:
+            finalized_chunk = self._finalize_chunk(current_chunk)
+            if finalized_chunk['content'].strip():
+                chunks.append(finalized_chunk)
         
         return chunks
     
+    def _new_chunk(self, content: str) -> Dict[str, Any]:
+        """Start a chunk whose content is accumulated as a list of fragments"""
+        return {
+            'content': [content] if content else [],
+            'length': len(content),
+            'metadata': {
+                'scenes': set(),
+                'characters': set(),
+                'text_types_mask': 0,
+                # Types the loader emits beyond the ones with a bit assigned
+                'other_text_types': set(),
+                'page_numbers_mask': 0
+            }
+        }
+    
     def _format_document_content(self, doc: BaseDocument) -> str:
         """Format document content with context markers"""
-        content = doc.text
-        metadata = doc.metadata
-        text_type = metadata.get('text_type', 'unknown')
-        
-        if text_type == 'dialog':
-            character = metadata.get('character', 'UNKNOWN')
-            return f"{character}: {content}"
-        elif text_type == 'scene_description':
-            return f"[SCENE] {content}"
-        else:
-            return content
+        formatter = self._content_formatters.get(doc.metadata.get('text_type'))
+        if formatter is None:
+            return doc.text
+        return formatter(doc)
     
     def _get_overlap_text(self, text: str) -> str:
         """Get overlap text from the end of current chunk"""
@@ -131,28 +152,40 @@ class MatrixDocumentLoaderService(DocumentLoaderService):
         overlap_text = text[-self.overlap:]
         
         # Find the first sentence boundary in the overlap
-        sentence_match = re.search(r'[.!?]\s+', overlap_text)
+        sentence_match = _SENTENCE_BOUNDARY_RE.search(overlap_text)
         if sentence_match:
             return overlap_text[sentence_match.end():]
         
         # Find the first paragraph boundary
-        paragraph_match = re.search(r'\n\n', overlap_text)
-        if paragraph_match:
-            return overlap_text[paragraph_match.end():]
+        paragraph_index = overlap_text.find('\n\n')
+        if paragraph_index != -1:
+            return overlap_text[paragraph_index + 2:]
         
         return overlap_text
     
     def _finalize_chunk(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
-        """Convert sets to lists for serialization"""
+        """Join content fragments and convert sets and bitmasks to lists for serialization"""
         metadata = chunk['metadata']
         return {
-            'content': chunk['content'],
+            'content': ''.join(chunk['content']),
             'metadata': {
                 'scenes': list(metadata['scenes']),
                 'characters': list(metadata['characters']),
-                'text_types': list(metadata['text_types']),
-                'page_numbers': list(metadata['page_numbers']),
+                'text_types': [
+                    text_type for text_type, bit in _TEXT_TYPE_BITS.items()
+                    if metadata['text_types_mask'] & bit
+                ] + list(metadata['other_text_types']),
+                'page_numbers': self._decode_page_numbers(metadata['page_numbers_mask']),
                 'scene_count': len(metadata['scenes']),
                 'character_count': len(metadata['characters'])
             }
-        }
\ No newline at end of file
+        }
+    
+    def _decode_page_numbers(self, page_numbers_mask: int) -> List[int]:
+        """Expand a page number bitmask into a sorted list of page numbers"""
+        page_numbers = []
+        while page_numbers_mask:
+            lowest_bit = page_numbers_mask & -page_numbers_mask
+            page_numbers.append(lowest_bit.bit_length() - 1)
+            page_numbers_mask ^= lowest_bit
+        return page_numbers
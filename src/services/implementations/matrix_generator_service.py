@@ -1,41 +1,42 @@
+import asyncio
+import json
 import logging
-from typing import List, Set
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import pydantic_core
 from pydantic_ai import Agent
+from pydantic_ai.messages import ToolCallPart
 from src.schemas.models import AdvancedMatrixResponse, Document, QueryDecomposition, QueryResult, MatrixResponse, SubQueryResponse
 from ..interfaces.generator_service import GeneratorService
+from ..interfaces.retriever_service import RetrieverService
 
 logger = logging.getLogger(__name__)
 
+# Indicators of complex queries
+_COMPLEX_INDICATORS = (
+    "how many times",
+    "why are",
+    "describe",
+    "personality",
+    "offer",
+    "exchange",
+    "purpose",
+    "who created",
+    "similar to",
+    "and who",
+    "why did",
+    "what is the relationship",
+)
+_COMPLEX_INDICATORS_RE = re.compile("|".join(map(re.escape, _COMPLEX_INDICATORS)), re.IGNORECASE)
 
-class MatrixGeneratorService(GeneratorService):
-    """Advanced LLM agent service for Matrix script queries with multi-step reasoning"""
+_WORD_RE = re.compile(r"\w+")
 
-    def __init__(self, model_name: str = "openai:gpt-4.1-mini-2025-04-14"):
-        self.model_name = model_name
-        
-        # Main response agent
-        self.response_agent = Agent(
-            model_name,
-            output_type=MatrixResponse,
-            system_prompt=self._get_response_system_prompt()
-        )
-        
-        # Query decomposition agent
-        self.decomposition_agent = Agent(
-            model_name,
-            output_type=QueryDecomposition,
-            system_prompt=self._get_decomposition_system_prompt()
-        )
-        
-        # Advanced reasoning agent for complex queries
-        self.advanced_agent = Agent(
-            model_name,
-            output_type=AdvancedMatrixResponse,
-            system_prompt=self._get_advanced_system_prompt()
-        )
-    
-    def _get_response_system_prompt(self) -> str:
-        return """You are a specialized assistant for analyzing The Matrix movie script. Your job is to answer questions based ONLY on the provided script context.
+# Rough size of a token in English text, used to budget context without a tokenizer round-trip
+_CHARS_PER_TOKEN = 4
+
+_RESPONSE_SYSTEM_PROMPT = """You are a specialized assistant for analyzing The Matrix movie script. Your job is to answer questions based ONLY on the provided script context.
 
 CRITICAL RULES:
 1. ONLY use information from the provided script context - never use your general knowledge about The Matrix movie
@@ -52,9 +53,8 @@ RESPONSE FORMAT:
 - Reasoning: Explain your thought process (optional)
 
 IMPORTANT: If you cannot find sufficient information in the context to answer the question, set confidence to 0.0 and explain what information is missing."""
-    
-    def _get_decomposition_system_prompt(self) -> str:
-        return """You are a query decomposition expert for The Matrix movie script. Your job is to break down complex questions into simpler subqueries that can be answered independently and then combined.
+
+_DECOMPOSITION_SYSTEM_PROMPT = """You are a query decomposition expert for The Matrix movie script. Your job is to break down complex questions into simpler subqueries that can be answered independently and then combined.
 
 TASK:
 Analyze the user's complex query and break it down into 2-5 simpler subqueries that:
@@ -82,8 +82,7 @@ Subqueries:
 3. "What reasoning or evidence does the character provide for this comparison?"
 """
 
-    def _get_advanced_system_prompt(self) -> str:
-        return """You are an advanced reasoning agent for analyzing The Matrix movie script. Your job is to synthesize answers to complex questions by combining information from multiple subqueries.
+_ADVANCED_SYSTEM_PROMPT = """You are an advanced reasoning agent for analyzing The Matrix movie script. Your job is to synthesize answers to complex questions by combining information from multiple subqueries.
 
 TASK:
 Create a comprehensive final answer based on the responses to multiple subqueries. You will:
@@ -107,10 +106,83 @@ RESPONSE FORMAT:
 - Subquery Responses: Include all individual subquery responses
 - Sources: Aggregate all document IDs used across subqueries
 """
+
+
+@lru_cache(maxsize=None)
+def _get_agent(model_name: str, output_type: type, system_prompt: str) -> Agent:
+    """Share one agent per model, output type and prompt across service instances"""
+    return Agent(model_name, output_type=output_type, system_prompt=system_prompt)
+
+
+class MatrixGeneratorService(GeneratorService):
+    """Advanced LLM agent service for Matrix script queries with multi-step reasoning"""
+
+    def __init__(
+        self,
+        model_name: str = "openai:gpt-4.1-mini-2025-04-14",
+        max_parallel_subqueries: int = 5,
+        draft_confidence_threshold: float = 0.85,
+        retriever: Optional[RetrieverService] = None,
+        subquery_top_k: int = 10,
+        max_context_tokens: int = 8000,
+        min_subquery_confidence: float = 0.1,
+        max_subqueries: int = 5
+    ):
+        self.model_name = model_name
+        self.max_parallel_subqueries = max_parallel_subqueries
+        self.draft_confidence_threshold = draft_confidence_threshold
+        # When set, every subquery is answered from its own retrieved context
+        self.retriever = retriever
+        self.subquery_top_k = subquery_top_k
+        self.max_context_tokens = max_context_tokens
+        self.min_subquery_confidence = min_subquery_confidence
+        self.max_subqueries = max_subqueries
+        # Decompositions started ahead of generation, shared by every run of the same query in flight
+        self._prefetched_decompositions: Dict[str, asyncio.Task] = {}
+        self._prefetch_runs: Counter = Counter()
+        
+        # Main response agent
+        self.response_agent = _get_agent(model_name, MatrixResponse, _RESPONSE_SYSTEM_PROMPT)
+        
+        # Query decomposition agent
+        self.decomposition_agent = _get_agent(model_name, QueryDecomposition, _DECOMPOSITION_SYSTEM_PROMPT)
+        
+        # Advanced reasoning agent for complex queries
+        self.advanced_agent = _get_agent(model_name, AdvancedMatrixResponse, _ADVANCED_SYSTEM_PROMPT)
+    
+    def prefetch(self, query: str) -> Optional[asyncio.Task]:
+        """Start decomposing a complex query while its context is still being retrieved"""
+        if not self._is_complex_query(query):
+            return None
+        
+        task = self._prefetched_decompositions.get(query)
+        if task is None:
+            task = asyncio.create_task(self._decompose_query(query))
+            self._prefetched_decompositions[query] = task
+        self._prefetch_runs[query] += 1
+        return task
+    
+    def discard_prefetch(self, query: str, prefetched: Optional[asyncio.Task]) -> None:
+        """Release a run's share of a decomposition, cancelling it once no run in flight needs it"""
+        if prefetched is None or self._prefetched_decompositions.get(query) is not prefetched:
+            return
+        
+        self._prefetch_runs[query] -= 1
+        if self._prefetch_runs[query] > 0:
+            return
+        
+        del self._prefetch_runs[query]
+        del self._prefetched_decompositions[query]
+        if not prefetched.done():
+            prefetched.cancel()
+        elif not prefetched.cancelled():
+            # Mark the exception as retrieved; the generation that awaited it already raised it
+            prefetched.exception()
     
     async def generate_response(self, query: str, context: List[Document]) -> QueryResult:
         """Generate response using a multi-step reasoning process for complex queries"""
         logger.info(f"Processing query: {query}")
+        context = self._dedupe_and_truncate(context)
         
         # Check if this is likely a complex query requiring decomposition
         if self._is_complex_query(query):
@@ -120,29 +192,68 @@ RESPONSE FORMAT:
             logger.info("Using standard response approach for simpler query")
             return await self._handle_simple_query(query, context)
     
+    async def generate_response_stream(self, query: str, context: List[Document]) -> AsyncIterator[str]:
+        """Generate a response, yielding the answer text as the final agent produces it"""
+        logger.info(f"Streaming query: {query}")
+        context = self._dedupe_and_truncate(context)
+        
+        try:
+            if not self._is_complex_query(query):
+                stream = self._stream_output_field(
+                    self.response_agent, self._build_response_prompt(query, context), "answer"
+                )
+            else:
+                formatted_context = self._format_context(context)
+                decomposition, draft = await self._decompose_with_draft(query, context, formatted_context)
+                if draft.confidence >= self.draft_confidence_threshold:
+                    logger.info(f"Draft answer confident enough ({draft.confidence}) - skipping subqueries")
+                    yield draft.answer
+                    return
+                
+                subquery_responses, _ = await self._answer_subqueries(
+                    decomposition.subqueries, context, formatted_context
+                )
+                if self._lacks_support(subquery_responses):
+                    logger.info("No subquery found supporting context - skipping synthesis")
+                    yield draft.answer
+                    return
+                
+                stream = self._stream_output_field(
+                    self.advanced_agent, self._build_synthesis_prompt(query, subquery_responses), "final_answer"
+                )
+            
+            async for chunk in stream:
+                yield chunk
+                
+        except Exception as e:
+            logger.error(f"Error in streamed query handling: {str(e)}")
+            yield f"I encountered an error while processing your query: {str(e)}"
+    
+    async def _stream_output_field(self, agent: Agent, prompt: str, field: str) -> AsyncIterator[str]:
+        """Run an agent in streaming mode and yield the growth of one text field of its structured output"""
+        emitted = ""
+        async with agent.run_stream(prompt) as result:
+            # Partial outputs only validate once every required field has arrived, so read the field
+            # straight from the partially streamed tool call arguments instead
+            async for message, _ in result.stream_structured(debounce_by=None):
+                for part in message.parts:
+                    if not isinstance(part, ToolCallPart):
+                        continue
+                    
+                    args = part.args
+                    if isinstance(args, str):
+                        args = pydantic_core.from_json(args or "{}", allow_partial="trailing-strings")
+                    
+                    text = args.get(field) if isinstance(args, dict) else None
+                    if isinstance(text, str) and len(text) > len(emitted) and text.startswith(emitted):
+                        yield text[len(emitted):]
+                        emitted = text
+    
     def _is_complex_query(self, query: str) -> bool:
         """Determine if a query is complex based on keywords and structure"""
-        # Look for indicators of complex queries
-        complex_indicators = [
-            "how many times",
-            "why are",
-            "describe",
-            "personality",
-            "offer",
-            "exchange",
-            "purpose",
-            "who created",
-            "similar to",
-            "and who",
-            "why did",
-            "what is the relationship"
-        ]
-        
         # Check if query contains any complex indicators
-        query_lower = query.lower()
-        for indicator in complex_indicators:
-            if indicator in query_lower:
-                return True
+        if _COMPLEX_INDICATORS_RE.search(query):
+            return True
         
         # Check if query has multiple question marks
         if query.count("?") > 1:
@@ -150,16 +261,14 @@ RESPONSE FORMAT:
             
         return False
     
-    async def _handle_simple_query(self, query: str, context: List[Document]) -> QueryResult:
+    async def _handle_simple_query(
+        self,
+        query: str,
+        context: List[Document],
+        formatted_context: Optional[str] = None
+    ) -> QueryResult:
         """Handle simpler queries directly with the response agent"""
-        context_text = self._format_context(context)
-        
-        prompt = f"""User Query: {query}
-
-Script Context:
-{context_text}
-
-Please answer the user's query based on the provided script context."""
+        prompt = self._build_response_prompt(query, context, formatted_context)
         
         try:
             result = await self.response_agent.run(prompt)
@@ -186,31 +295,25 @@ Please answer the user's query based on the provided script context."""
     async def _handle_complex_query(self, query: str, context: List[Document]) -> QueryResult:
         """Handle complex queries using query decomposition and multi-step reasoning"""
         try:
-            # Step 1: Decompose the query into subqueries
-            decomposition = await self._decompose_query(query)
-            logger.info(f"Query decomposed into {len(decomposition.subqueries)} subqueries")
+            # The draft and every subquery without its own context share one formatted context
+            formatted_context = self._format_context(context)
             
-            # Step 2: Answer each subquery individually
-            subquery_responses = []
-            all_sources: Set[str] = set()
+            # Step 1: Decompose the query while speculatively drafting a direct answer
+            decomposition, draft = await self._decompose_with_draft(query, context, formatted_context)
+            if draft.confidence >= self.draft_confidence_threshold:
+                logger.info(f"Draft answer confident enough ({draft.confidence}) - skipping subqueries")
+                return draft
             
-            for subquery in decomposition.subqueries:
-                logger.info(f"Processing subquery: {subquery}")
-                # Use the response agent to answer each subquery
-                subquery_result = await self._handle_simple_query(subquery, context)
-                
-                subquery_response = SubQueryResponse(
-                    subquery=subquery,
-                    answer=subquery_result.answer,
-                    confidence=subquery_result.confidence,
-                    sources_used=subquery_result.sources_used
-                )
-                
-                subquery_responses.append(subquery_response)
-                all_sources.update(subquery_result.sources_used)
+            # Step 2: Answer the subqueries concurrently
+            subquery_responses, all_sources = await self._answer_subqueries(
+                decomposition.subqueries, context, formatted_context
+            )
+            if self._lacks_support(subquery_responses):
+                logger.info("No subquery found supporting context - skipping synthesis")
+                return draft
             
             # Step 3: Synthesize the final answer using the advanced agent
-            return await self._synthesize_final_answer(query, subquery_responses, list(all_sources))
+            return await self._synthesize_final_answer(query, subquery_responses, all_sources)
             
         except Exception as e:
             logger.error(f"Error in complex query handling: {str(e)}")
@@ -221,35 +324,162 @@ Please answer the user's query based on the provided script context."""
                 sources_used=[],
             )
     
+    async def _decompose_with_draft(
+        self,
+        query: str,
+        context: List[Document],
+        formatted_context: str
+    ) -> Tuple[QueryDecomposition, QueryResult]:
+        """Decompose the query and draft a direct answer concurrently"""
+        decomposition_task = asyncio.create_task(self._claim_decomposition(query))
+        draft_task = asyncio.create_task(self._handle_simple_query(query, context, formatted_context))
+        try:
+            decomposition, draft = await asyncio.gather(decomposition_task, draft_task)
+        except BaseException:
+            # Without this a failed call would leave the other LLM call running unawaited
+            decomposition_task.cancel()
+            draft_task.cancel()
+            raise
+        logger.info(f"Query decomposed into {len(decomposition.subqueries)} subqueries")
+        return decomposition, draft
+    
+    async def _claim_decomposition(self, query: str) -> QueryDecomposition:
+        """Await the prefetched decomposition of a query, decomposing it here when none was started"""
+        prefetched = self._prefetched_decompositions.get(query)
+        if prefetched is None:
+            return await self._decompose_query(query)
+        # Other runs may still await it, so cancelling this one must not cancel the shared task
+        return await asyncio.shield(prefetched)
+    
+    async def _answer_subqueries(
+        self,
+        subqueries: List[str],
+        context: List[Document],
+        formatted_context: str
+    ) -> Tuple[List[SubQueryResponse], List[str]]:
+        """Answer the subqueries concurrently, bounded to respect provider rate limits"""
+        subquery_contexts = await self._retrieve_subquery_contexts(subqueries, context)
+        semaphore = asyncio.Semaphore(self.max_parallel_subqueries)
+        subquery_results = await asyncio.gather(
+            *(
+                self._answer_subquery(
+                    subquery,
+                    subquery_context,
+                    semaphore,
+                    formatted_context if subquery_context is context else None
+                )
+                for subquery, subquery_context in zip(subqueries, subquery_contexts)
+            ),
+            return_exceptions=True
+        )
+        
+        subquery_responses = []
+        
+        for subquery, subquery_result in zip(subqueries, subquery_results):
+            if isinstance(subquery_result, Exception):
+                # A failed subquery becomes a zero-confidence answer instead of aborting the batch
+                logger.error(f"Error in subquery '{subquery}': {str(subquery_result)}")
+                subquery_result = QueryResult(
+                    query=subquery,
+                    answer=f"I encountered an error while processing this subquery: {str(subquery_result)}",
+                    confidence=0.0,
+                    sources_used=[],
+                )
+            
+            subquery_response = SubQueryResponse(
+                subquery=subquery,
+                answer=subquery_result.answer,
+                confidence=subquery_result.confidence,
+                sources_used=subquery_result.sources_used
+            )
+            
+            subquery_responses.append(subquery_response)
+        
+        # Union of the sources in first-cited order
+        all_sources = list(dict.fromkeys(
+            source for resp in subquery_responses for source in resp.sources_used
+        ))
+        
+        return subquery_responses, all_sources
+    
+    def _lacks_support(self, subquery_responses: List[SubQueryResponse]) -> bool:
+        """Check whether no subquery found context to support an answer, so synthesis has nothing to combine"""
+        return all(resp.confidence < self.min_subquery_confidence for resp in subquery_responses)
+    
+    async def _retrieve_subquery_contexts(self, subqueries: List[str], context: List[Document]) -> List[List[Document]]:
+        """Prefetch the context of every subquery in one batch, falling back to the shared context"""
+        if self.retriever is None:
+            return [context] * len(subqueries)
+        
+        try:
+            batch_results = await self.retriever.retrieve_batch(
+                subqueries, top_k=self.subquery_top_k, with_metadata=False
+            )
+        except Exception as e:
+            logger.error(f"Error retrieving subquery contexts: {str(e)}")
+            return [context] * len(subqueries)
+        
+        return [
+            self._dedupe_and_truncate([rr.document for rr in retrieval_results]) or context
+            for retrieval_results in batch_results
+        ]
+    
+    async def _answer_subquery(
+        self,
+        subquery: str,
+        context: List[Document],
+        semaphore: asyncio.Semaphore,
+        formatted_context: Optional[str] = None
+    ) -> QueryResult:
+        """Answer a single subquery with the response agent"""
+        async with semaphore:
+            logger.info(f"Processing subquery: {subquery}")
+            return await self._handle_simple_query(subquery, context, formatted_context)
+    
     async def _decompose_query(self, query: str) -> QueryDecomposition:
         """Decompose a complex query into subqueries"""
-        prompt = f"""Please decompose the following complex query into simpler subqueries:
-
-Original Query: {query}
+        prompt = f"""Please decompose the following complex query into 2-5 specific subqueries that will help answer the original query.
 
-Break this down into 2-5 specific subqueries that will help answer the original query."""
+Original Query: {query}"""
 
         result = await self.decomposition_agent.run(prompt)
-        return result.output
+        decomposition = result.output
+        decomposition.subqueries = self._prune_subqueries(query, decomposition.subqueries)
+        return decomposition
+    
+    def _prune_subqueries(self, query: str, subqueries: List[str]) -> List[str]:
+        """Drop repeated subqueries and restatements of the query, capped at max_subqueries"""
+        query_tokens = set(_WORD_RE.findall(query.lower()))
+        seen_subqueries: Set[str] = set()
+        pruned_subqueries = []
+        
+        for subquery in subqueries:
+            subquery_key = " ".join(subquery.lower().split())
+            if subquery_key in seen_subqueries:
+                continue
+            seen_subqueries.add(subquery_key)
+            
+            # A restated query is already covered by the direct draft answer
+            subquery_tokens = set(_WORD_RE.findall(subquery_key))
+            union_size = len(query_tokens | subquery_tokens)
+            if union_size and len(query_tokens & subquery_tokens) / union_size > 0.9:
+                continue
+            
+            pruned_subqueries.append(subquery)
+            if len(pruned_subqueries) == self.max_subqueries:
+                break
+        
+        if len(pruned_subqueries) < len(subqueries):
+            logger.info(f"Pruned subqueries from {len(subqueries)} to {len(pruned_subqueries)}")
+        
+        return pruned_subqueries
     
     async def _synthesize_final_answer(self, 
                                       original_query: str, 
                                       subquery_responses: List[SubQueryResponse],
                                       all_sources: List[str]) -> QueryResult:
         """Synthesize a final answer from subquery responses"""
-        
-        # Format the subquery responses for the agent
-        subqueries_text = "\n\n".join([
-            f"Subquery: {resp.subquery}\nAnswer: {resp.answer}\nConfidence: {resp.confidence}\nSources: {', '.join(resp.sources_used)}"
-            for resp in subquery_responses
-        ])
-        
-        prompt = f"""Original Complex Query: {original_query}
-
-Subquery Responses:
-{subqueries_text}
-
-Based on these subquery responses, please synthesize a comprehensive final answer to the original query."""
+        prompt = self._build_synthesis_prompt(original_query, subquery_responses)
 
         try:
             result = await self.advanced_agent.run(prompt)
@@ -277,6 +507,63 @@ Based on these subquery responses, please synthesize a comprehensive final answe
                 reasoning="Unable to complete full synthesis - using highest confidence partial result."
             )
     
+    def _build_response_prompt(
+        self,
+        query: str,
+        context: List[Document],
+        formatted_context: Optional[str] = None
+    ) -> str:
+        """Build the response agent prompt for a query and its context"""
+        context_text = formatted_context if formatted_context is not None else self._format_context(context)
+        
+        # Invariant instructions first and the query last, so calls sharing a context share a cacheable prefix
+        return f"""Please answer the user's query based on the provided script context.
+
+Script Context:
+{context_text}
+
+User Query: {query}"""
+    
+    def _build_synthesis_prompt(self, original_query: str, subquery_responses: List[SubQueryResponse]) -> str:
+        """Build the advanced agent prompt from the subquery responses"""
+        # Compact JSON states every field once per response without repeating human-readable labels
+        subqueries_text = json.dumps(
+            [resp.model_dump() for resp in subquery_responses],
+            separators=(",", ":"),
+            ensure_ascii=False
+        )
+        
+        return f"""Based on the subquery responses below, please synthesize a comprehensive final answer to the original query.
+
+Subquery Responses (JSON):
+{subqueries_text}
+
+Original Complex Query: {original_query}"""
+    
+    def _dedupe_and_truncate(self, context: List[Document]) -> List[Document]:
+        """Drop repeated documents and cap the context at the token budget, keeping retrieval order"""
+        max_chars = self.max_context_tokens * _CHARS_PER_TOKEN
+        seen_contents: Set[str] = set()
+        trimmed_context = []
+        total_chars = 0
+        
+        for doc in context:
+            content_key = " ".join(doc.page_content.split())
+            if content_key in seen_contents:
+                continue
+            
+            total_chars += len(doc.page_content)
+            if total_chars > max_chars and trimmed_context:
+                break
+            
+            seen_contents.add(content_key)
+            trimmed_context.append(doc)
+        
+        if len(trimmed_context) < len(context):
+            logger.info(f"Trimmed context from {len(context)} to {len(trimmed_context)} documents")
+        
+        return trimmed_context
+    
     def _format_context(self, context: List[Document]) -> str:
         """Format context documents for agent prompts"""
         return "\n\n".join([f"Document ID: {doc.id}\nContent: {doc.page_content}" for doc in context])
@@ -1,107 +1,360 @@
+import asyncio
 import logging
-from typing import List
+import math
+import os
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple, Union
 from langchain_openai import OpenAIEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Distance,
+    HnswConfigDiff,
+    OptimizersConfigDiff,
+    PointStruct,
+    QuantizationSearchParams,
+    QueryRequest,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
 
-from src.schemas.models import Document, RetrievalResult
+from src.schemas.models import Document, DocumentBatch, RetrievalResult
 from ..interfaces.retriever_service import RetrieverService
+from .embedding_cache import EmbeddingCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Number of query embeddings kept per retriever; repeated questions skip the embedding call
+_QUERY_EMBEDDING_CACHE_SIZE = 2048
+
+# Points per upload request when indexing
+_UPLOAD_BATCH_SIZE = 64
+# Upsert requests in flight at once when indexing asynchronously
+_UPSERT_CONCURRENCY = 8
+# Documents per embedding request when indexing asynchronously; each chunk is upserted while the next is embedded
+_EMBED_BATCH_SIZE = 512
+# Indexing threshold (KB) restored once a bulk upload has finished
+_INDEXING_THRESHOLD = 20000
+
+
+def create_qdrant_clients(config) -> Tuple[QdrantClient, Optional[AsyncQdrantClient]]:
+    """Create the sync client used for indexing and admin calls and the async one used for queries"""
+    # A local store only lives inside its own client, so local modes query it from a worker thread.
+    # Remote clients prefer gRPC, whose framing pays off most on the batch upload and query endpoints.
+    if config.qdrant_use_memory and config.qdrant_path:
+        return QdrantClient(path=config.qdrant_path), None
+    if config.qdrant_use_memory:
+        return QdrantClient(":memory:"), None
+    
+    client_kwargs = dict(
+        host=config.qdrant_host,
+        port=config.qdrant_port,
+        grpc_port=config.qdrant_grpc_port,
+        prefer_grpc=config.qdrant_prefer_grpc
+    )
+    return QdrantClient(**client_kwargs), AsyncQdrantClient(**client_kwargs)
+
 
 class QdrantRetrieverService(RetrieverService):
     """Qdrant-based vector retriever with OpenAI embeddings"""
     
+    # Set once the collection is known to hold documents; only indexing can change that
+    _initialized: bool = False
+    
     def __init__(
         self, 
-        config
+        config,
+        client: Optional[QdrantClient] = None,
+        async_client: Optional[AsyncQdrantClient] = None
     ):
         self.collection_name = config.collection_name
         self.embedding_dims = config.embedding_dims
-        self.use_memory = config.qdrant_use_memory
-        self.qdrant_host = config.qdrant_host
-        self.qdrant_port = config.qdrant_port
+        self.quantization = config.qdrant_quantization
+        if self.quantization not in (None, "scalar", "binary"):
+            raise ValueError(f"Unsupported Qdrant quantization: {self.quantization}")
+        self.hnsw_ef = config.qdrant_hnsw_ef
+        self.indexed_only = config.qdrant_indexed_only
+        self.hnsw_config = HnswConfigDiff(
+            m=config.qdrant_hnsw_m,
+            ef_construct=config.qdrant_hnsw_ef_construct,
+            max_indexing_threads=config.qdrant_max_indexing_threads
+        )
         
         # Initialize embeddings
         self.embeddings = OpenAIEmbeddings(
             model=config.embedding_model,
             dimensions=config.embedding_dims
         )
+        self._query_embedding_cache: OrderedDict[str, List[float]] = OrderedDict()
         
-        # Initialize Qdrant client
-        if self.use_memory:
-            self.client = QdrantClient(":memory:")
-        else:
-            self.client = QdrantClient(host=self.qdrant_host, port=self.qdrant_port)
+        # Document vectors persisted across indexing runs
+        self.embedding_cache = (
+            EmbeddingCache(config.embedding_cache_path, f"{config.embedding_model}:{config.embedding_dims}")
+            if config.embedding_cache_path
+            else None
+        )
         
-        if self._collection_exists():
-            self._init_vector_store()
-        else:
-            self.vectorstore = None
+        # Reuse the process-wide clients when given, otherwise open dedicated ones
+        if client is None:
+            client, async_client = create_qdrant_clients(config)
+        self.client = client
+        self.async_client = async_client
 
-    def index_documents(self, documents: List[Document]) -> None:
+    def index_documents(self, documents: Union[List[Document], DocumentBatch]) -> None:
         """Index documents in Qdrant"""
-        if not documents:
+        batch = self._to_batch(documents)
+        if not len(batch):
             return
 
+        self._initialized = False
         self._create_collection()
-
-        if self.vectorstore is None:
-            self._init_vector_store()
         
-        self.vectorstore.add_documents(documents)
+        # Embed everything up front so the upload itself is pure I/O
+        texts = batch.texts
+        vectors = self._lookup_document_vectors(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_vectors = self.embeddings.embed_documents([texts[i] for i in missing])
+            self._fill_document_vectors(texts, vectors, missing, missing_vectors)
+        
+        self.client.upload_points(
+            collection_name=self.collection_name,
+            points=self._to_points(batch, vectors),
+            batch_size=_UPLOAD_BATCH_SIZE,
+            parallel=min(os.cpu_count() or 1, math.ceil(len(batch) / _UPLOAD_BATCH_SIZE)),
+            wait=True
+        )
+        
+        # Re-enable indexing so the index is built once over the complete collection
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=_INDEXING_THRESHOLD)
+        )
+        self._initialized = True
+    
+    async def aindex_documents(
+        self,
+        documents: Union[List[Document], DocumentBatch],
+        concurrency: int = _UPSERT_CONCURRENCY,
+        batch_size: int = _UPLOAD_BATCH_SIZE,
+        embed_batch_size: int = _EMBED_BATCH_SIZE
+    ) -> None:
+        """Index documents in Qdrant, upserting embedded chunks concurrently while later chunks are embedded"""
+        batch = self._to_batch(documents)
+        if not len(batch):
+            return
+        
+        # Local stores only live inside the sync client
+        if self.async_client is None:
+            await asyncio.to_thread(self.index_documents, batch)
+            return
+        
+        self._initialized = False
+        await asyncio.to_thread(self._create_collection)
+        
+        # Bounded so embedding never runs far ahead of the upserts
+        point_batches: asyncio.Queue[Optional[List[PointStruct]]] = asyncio.Queue(maxsize=concurrency)
+        
+        async def embed_chunks() -> None:
+            for start in range(0, len(batch), embed_batch_size):
+                chunk = batch.slice(start, start + embed_batch_size)
+                points = self._to_points(chunk, await self._aembed_documents(chunk.texts))
+                for points_start in range(0, len(points), batch_size):
+                    await point_batches.put(points[points_start:points_start + batch_size])
+            
+            for _ in range(concurrency):
+                await point_batches.put(None)
+        
+        async def upsert_batches() -> None:
+            while (points := await point_batches.get()) is not None:
+                await self.async_client.upsert(
+                    collection_name=self.collection_name,
+                    points=points,
+                    wait=True
+                )
+        
+        # A failing stage cancels the others instead of leaving them blocked on the queue
+        async with asyncio.TaskGroup() as stages:
+            stages.create_task(embed_chunks())
+            for _ in range(concurrency):
+                stages.create_task(upsert_batches())
+        
+        # Re-enable indexing so the index is built once over the complete collection
+        await self.async_client.update_collection(
+            collection_name=self.collection_name,
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=_INDEXING_THRESHOLD)
+        )
+        self._initialized = True
     
-    def retrieve(self, query: str, top_k: int = 5) -> List[RetrievalResult]:
+    async def retrieve(self, query: str, top_k: int = 5, with_metadata: bool = True) -> List[RetrievalResult]:
         """Retrieve relevant documents for a query"""
-        if not self.is_initialized():
+        return (await self.retrieve_batch([query], top_k=top_k, with_metadata=with_metadata))[0]
+    
+    async def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        with_metadata: bool = True
+    ) -> List[List[RetrievalResult]]:
+        """Retrieve relevant documents for several queries with one embedding call and one search"""
+        if not queries:
+            return []
+        
+        if not await self._is_initialized_async():
             raise ValueError("No documents have been indexed yet. Call index_documents first.")
         
-        search_results = self.vectorstore.similarity_search_with_score(
-            query=query,
-            k=top_k
+        query_vectors = await self._embed_queries(queries)
+        batch_results = await self._call_client(
+            "query_batch_points",
+            collection_name=self.collection_name,
+            requests=[
+                QueryRequest(
+                    query=query_vector,
+                    limit=top_k,
+                    # Generation only reads the text, so the metadata is left on the server unless asked for
+                    with_payload=True if with_metadata else ["page_content"],
+                    params=self._search_params()
+                )
+                for query_vector in query_vectors
+            ]
         )
         
-        # Get RetrievalResults
-        results = []
-        for i, (doc, score) in enumerate(search_results):
-            result = RetrievalResult(
-                document=Document(
-                    id=doc.metadata.get("_id", f"result-{i}"),
-                    page_content=doc.page_content,
-                    metadata={k: v for k, v in doc.metadata.items() if k != "_id"}
-                ),
-                score=score,
-                rank=i + 1
-            )
-            results.append(result)
-        
-        return results
+        return [self._to_retrieval_results(response.points) for response in batch_results]
+    
+    async def embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the cached vector of a recent identical query"""
+        return (await self._embed_queries([query]))[0]
+    
+    async def warm_up(self) -> None:
+        """Open the embedding and Qdrant connections used by the query path"""
+        await asyncio.gather(
+            self.embeddings.aembed_query(" "),
+            self._call_client("get_collections")
+        )
     
     def is_initialized(self) -> bool:
         """Check if the collection has documents"""
+        if self._initialized:
+            return True
+        
         if not self._collection_exists():
             return False
             
         collection_info = self.client.get_collection(self.collection_name)
-        return collection_info.points_count > 0
+        self._initialized = collection_info.points_count > 0
+        return self._initialized
+    
+    async def _aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed document texts, reusing vectors cached from earlier indexing runs"""
+        vectors = await asyncio.to_thread(self._lookup_document_vectors, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_vectors = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            await asyncio.to_thread(self._fill_document_vectors, texts, vectors, missing, missing_vectors)
+        return vectors
+    
+    def _lookup_document_vectors(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Get the vectors of previously embedded documents, None for the ones still to embed"""
+        if self.embedding_cache is None:
+            return [None] * len(texts)
+        
+        vectors = self.embedding_cache.get_many(texts)
+        logger.info(f"Reusing {sum(v is not None for v in vectors)} of {len(texts)} cached document embeddings")
+        return vectors
+    
+    def _fill_document_vectors(
+        self,
+        texts: List[str],
+        vectors: List[Optional[List[float]]],
+        missing: List[int],
+        missing_vectors: List[List[float]]
+    ) -> None:
+        """Put freshly embedded vectors in place and persist them"""
+        for i, vector in zip(missing, missing_vectors):
+            vectors[i] = vector
+        
+        if self.embedding_cache is not None:
+            self.embedding_cache.put_many([texts[i] for i in missing], missing_vectors)
+    
+    async def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries with one call for the ones not cached yet"""
+        vectors_by_query = {q: self._query_embedding_cache.get(q) for q in queries}
+        missing_queries = [q for q, query_vector in vectors_by_query.items() if query_vector is None]
+        if missing_queries:
+            missing_vectors = await self.embeddings.aembed_documents(missing_queries)
+            vectors_by_query.update(zip(missing_queries, missing_vectors))
+        
+        for query, query_vector in vectors_by_query.items():
+            self._cache_query_embedding(query, query_vector)
+        
+        return [vectors_by_query[q] for q in queries]
+    
+    def _cache_query_embedding(self, query: str, query_vector: List[float]) -> None:
+        """Store a query embedding, evicting the least recently used ones"""
+        self._query_embedding_cache[query] = query_vector
+        self._query_embedding_cache.move_to_end(query)
+        while len(self._query_embedding_cache) > _QUERY_EMBEDDING_CACHE_SIZE:
+            self._query_embedding_cache.popitem(last=False)
+    
+    async def _is_initialized_async(self) -> bool:
+        """Check if the collection has documents without blocking the event loop"""
+        if self._initialized:
+            return True
+        
+        if not await self._call_client("collection_exists", collection_name=self.collection_name):
+            return False
+        
+        collection_info = await self._call_client("get_collection", collection_name=self.collection_name)
+        self._initialized = collection_info.points_count > 0
+        return self._initialized
     
+    async def _call_client(self, method: str, **kwargs) -> Any:
+        """Call a Qdrant client method from the async query path"""
+        if self.async_client is not None:
+            return await getattr(self.async_client, method)(**kwargs)
+        
+        return await asyncio.to_thread(getattr(self.client, method), **kwargs)
+    
+    def _to_batch(self, documents: Union[List[Document], DocumentBatch]) -> DocumentBatch:
+        """Convert documents to columns once, so indexing never walks the document objects again"""
+        return documents if isinstance(documents, DocumentBatch) else DocumentBatch.from_documents(documents)
+    
+    def _to_points(self, batch: DocumentBatch, vectors: List[List[float]]) -> List[PointStruct]:
+        """Build points with payloads in the layout written by the LangChain vector store"""
+        return [
+            PointStruct(
+                id=id_,
+                vector=vector,
+                payload={"page_content": text, "metadata": metadata}
+            )
+            for id_, text, metadata, vector in zip(batch.ids, batch.texts, batch.metadatas, vectors)
+        ]
+    
+    def _to_retrieval_results(self, points) -> List[RetrievalResult]:
+        """Convert scored Qdrant points stored by the vector store into RetrievalResults"""
+        return [
+            RetrievalResult(
+                document=Document(
+                    id=str(point.id),
+                    page_content=point.payload.get("page_content", ""),
+                    metadata=point.payload.get("metadata") or {}
+                ),
+                score=point.score,
+                rank=i + 1
+            )
+            for i, point in enumerate(points)
+        ]
                 
     def _collection_exists(self) -> bool:
         """Check if the collection exists in Qdrant"""
         return self.client.collection_exists(self.collection_name)
 
 
-    def _init_vector_store(self) -> None:
-        """Initialize the vector store for document retrieval"""
-        self.vectorstore = QdrantVectorStore(
-            client=self.client,
-            collection_name=self.collection_name,
-            embedding=self.embeddings,
-        )    
-    
     def _create_collection(self) -> None:
         """Create the collection in Qdrant if it doesn't exist"""
         if not self._collection_exists():
@@ -110,7 +363,34 @@ class QdrantRetrieverService(RetrieverService):
                 vectors_config=VectorParams(
                     size=self.embedding_dims,
                     distance=Distance.COSINE
-                )
+                ),
+                hnsw_config=self.hnsw_config,
+                # No indexing while the collection is bulk loaded
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
+                quantization_config=self._quantization_config()
             )
         else:
             logger.info(f"Collection '{self.collection_name}' already exists")
+    
+    def _quantization_config(self) -> ScalarQuantization | BinaryQuantization | None:
+        """Quantization applied to the stored vectors, kept in RAM for the HNSW scan"""
+        if self.quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
+    
+    def _search_params(self) -> SearchParams:
+        """HNSW search settings, rescoring oversampled candidates with the original vectors when quantized"""
+        return SearchParams(
+            hnsw_ef=self.hnsw_ef,
+            indexed_only=self.indexed_only,
+            exact=False,
+            quantization=(
+                QuantizationSearchParams(rescore=True, oversampling=2.0)
+                if self.quantization is not None
+                else None
+            )
+        )
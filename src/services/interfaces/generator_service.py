@@ -1,6 +1,6 @@
 
 from abc import abstractmethod
-from typing import List
+from typing import Any, AsyncIterator, List, Optional
 from src.schemas.models import Document
 
 class GeneratorService:
@@ -10,3 +10,16 @@ class GeneratorService:
     async def generate_response(self, query: str, context: List[Document]) -> str:
         """Generate a response for a query using the provided context"""
         pass
+
+    def prefetch(self, query: str) -> Optional[Any]:
+        """Start the context-independent work for a query while its documents are retrieved"""
+        return None
+
+    def discard_prefetch(self, query: str, prefetched: Optional[Any]) -> None:
+        """Release the work returned by prefetch once the run that requested it is over"""
+        pass
+
+    async def generate_response_stream(self, query: str, context: List[Document]) -> AsyncIterator[str]:
+        """Generate a response for a query, yielding the answer text incrementally"""
+        result = await self.generate_response(query, context)
+        yield result.answer
@@ -1,18 +1,42 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List
-from src.schemas.models import Document, RetrievalResult
+from typing import List, Optional, Union
+from src.schemas.models import Document, DocumentBatch, RetrievalResult
 
 class RetrieverService(ABC):
     """Abstract base class for retriever services"""
 
     @abstractmethod
-    def index_documents(self, documents: List[Document]) -> None:
+    def index_documents(self, documents: Union[List[Document], DocumentBatch]) -> None:
         """Index documents for retrieval"""
         pass
     
+    async def aindex_documents(self, documents: Union[List[Document], DocumentBatch]) -> None:
+        """Index documents for retrieval without blocking the event loop"""
+        await asyncio.to_thread(self.index_documents, documents)
+    
     @abstractmethod
-    def retrieve(self, query: str, top_k: int = 5) -> List[RetrievalResult]:
-        """Retrieve relevant documents for a query"""
+    async def retrieve(self, query: str, top_k: int = 5, with_metadata: bool = True) -> List[RetrievalResult]:
+        """Retrieve relevant documents for a query, leaving out their metadata when it isn't needed"""
+        pass
+    
+    async def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        with_metadata: bool = True
+    ) -> List[List[RetrievalResult]]:
+        """Retrieve relevant documents for several queries at once"""
+        return list(await asyncio.gather(
+            *(self.retrieve(query, top_k=top_k, with_metadata=with_metadata) for query in queries)
+        ))
+    
+    async def embed_query(self, query: str) -> Optional[List[float]]:
+        """Embed a query the way retrieve does, None if the retriever has no query vectors"""
+        return None
+    
+    async def warm_up(self) -> None:
+        """Open connections ahead of the first query"""
         pass
     
     @abstractmethod
@@ -1,5 +1,9 @@
+import asyncio
 import logging
-from ..schemas.models import QueryResult
+import numpy as np
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Tuple
+from ..schemas.models import QueryResult, RetrievalResult
 from .interfaces.document_loader_service import DocumentLoaderService
 from .interfaces.retriever_service import RetrieverService
 from .interfaces.generator_service import GeneratorService
@@ -8,6 +12,56 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class SimLRUCache:
+    """
+    LRU cache of retrieval results that also serves queries whose embedding is
+    within a small cosine distance of a cached query.
+    """
+    def __init__(self, capacity: int, threshold_cos: float = 0.02):
+        self.capacity = capacity
+        self.threshold_cos = threshold_cos
+        self._entries: OrderedDict[str, Tuple[np.ndarray, int, bool, List[RetrievalResult]]] = OrderedDict()
+    
+    def get(self, query_vector: List[float], top_k: int, with_metadata: bool) -> Optional[List[RetrievalResult]]:
+        """Get the top_k results of the closest cached query, None if none is close enough"""
+        if not self._entries:
+            return None
+        
+        keys = list(self._entries)
+        matrix = np.stack([self._entries[key][0] for key in keys])
+        similarities = matrix @ self._normalize(query_vector)
+        best = int(np.argmax(similarities))
+        _, k_prime, has_metadata, results = self._entries[keys[best]]
+        
+        if 1.0 - similarities[best] > self.threshold_cos or top_k > k_prime or (with_metadata and not has_metadata):
+            return None
+        
+        self._entries.move_to_end(keys[best])
+        return results[:top_k]
+    
+    def put(
+        self,
+        key: str,
+        query_vector: List[float],
+        k_prime: int,
+        has_metadata: bool,
+        results: List[RetrievalResult]
+    ) -> None:
+        """Store the k_prime results retrieved for a query"""
+        self._entries[key] = (self._normalize(query_vector), k_prime, has_metadata, results)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+    
+    def _normalize(self, vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm > 0 else array
+
+
 class RAGService:
     """
     Retrieval-Augmented Generation (RAG) service for document-based question answering.
@@ -16,14 +70,23 @@ class RAGService:
             self,
             loader: DocumentLoaderService,
             retriever: RetrieverService,
-            generator: GeneratorService
+            generator: GeneratorService,
+            cache_size: int = 256,
+            similarity_cache_size: int = 0
     ):
         self.loader = loader
         self.retriever = retriever
         self.generator = generator
+        self.cache_size = cache_size
+        self._response_cache: OrderedDict[tuple, QueryResult] = OrderedDict()
+        # Pipelines currently running, shared by identical concurrent queries
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        # Retrieval results shared by near-duplicate questions
+        self._similarity_cache = SimLRUCache(similarity_cache_size) if similarity_cache_size > 0 else None
     
     def index(self) -> None:
         """Load and index documents if they haven't been indexed already"""
+        self._clear_caches()
         
         # Check if collection already exists and contains documents
         if self.retriever.is_initialized():
@@ -38,23 +101,144 @@ class RAGService:
         self.retriever.index_documents(documents)
         logger.info("Indexing complete")
 
+    async def aindex(self) -> None:
+        """Load and index documents if they haven't been indexed already, without blocking the event loop"""
+        self._clear_caches()
+        
+        if await asyncio.to_thread(self.retriever.is_initialized):
+            logger.info("Collection already exists and contains documents. Skipping indexing.")
+            return
+        
+        logger.info("Loading documents...")
+        # A worker thread keeps the loop free; parsing itself stays in-process unless the loader has workers
+        documents = await asyncio.to_thread(self.loader.load_documents)
+        logger.info(f"Loaded {len(documents)} documents")
+        
+        logger.info("Indexing documents...")
+        await self.retriever.aindex_documents(documents)
+        logger.info("Indexing complete")
+    
+    def _clear_caches(self) -> None:
+        """Drop cached answers and retrievals, which may refer to documents that are about to change"""
+        self._response_cache.clear()
+        if self._similarity_cache is not None:
+            self._similarity_cache.clear()
+
+    async def warm_up(self) -> None:
+        """Move connection setup out of the first request's critical path"""
+        logger.info("Warming up retriever connections...")
+        try:
+            await self.retriever.warm_up()
+        except Exception as e:
+            logger.warning(f"Warm-up failed, the first query will pay connection setup: {e}")
+
     async def query(self, question: str, top_k: int = 10, attach_documents: bool = False) -> QueryResult:
         """Query the RAG system"""
         logger.info(f"Processing query: '{question}' with top_k={top_k}")
         
-        # Retrieve relevant documents
-        retrieval_results = self.retriever.retrieve(question, top_k=top_k)
-        retrieved_docs = [rr.document for rr in retrieval_results]
+        cache_key = self._cache_key(question, top_k, attach_documents)
+        cached_result = self._response_cache.get(cache_key)
+        if cached_result is not None:
+            self._response_cache.move_to_end(cache_key)
+            logger.info("Serving response from cache")
+            return cached_result.model_copy(deep=True)
         
-        logger.debug(f"Retrieved {len(retrieved_docs)} documents")
+        inflight = self._inflight.get(cache_key)
+        if inflight is None:
+            inflight = asyncio.create_task(self._run_query(question, top_k, attach_documents, cache_key))
+            self._inflight[cache_key] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        else:
+            logger.info("Joining identical in-flight query")
         
-        # Generate response using LLM with context
-        result = await self.generator.generate_response(question, retrieved_docs)
-        logger.info(f"Generated response with confidence: {result.confidence}")
+        # A caller going away must not cancel the pipeline other callers are waiting on
+        result = await asyncio.shield(inflight)
+        return result.model_copy(deep=True)
+    
+    async def _run_query(
+            self,
+            question: str,
+            top_k: int,
+            attach_documents: bool,
+            cache_key: tuple
+    ) -> QueryResult:
+        """Run retrieval and generation for a query that isn't cached"""
+        # Let the generator start what doesn't depend on the documents, then retrieve them
+        prefetched = self.generator.prefetch(question)
+        try:
+            retrieval_results = await self._retrieve(question, top_k, with_metadata=attach_documents)
+            retrieved_docs = [rr.document for rr in retrieval_results]
+            
+            logger.debug(f"Retrieved {len(retrieved_docs)} documents")
+            
+            # Generate response using LLM with context
+            result = await self.generator.generate_response(question, retrieved_docs)
+            logger.info(f"Generated response with confidence: {result.confidence}")
+        finally:
+            # The prefetched work is shared with concurrent runs of the question; release this run's share
+            self.generator.discard_prefetch(question, prefetched)
         
         # Add retrieval information to result
         if attach_documents:
             result.retrieved_documents = retrieval_results
             logger.debug("Attached retrieval documents to result")
 
-        return result
\ No newline at end of file
+        # Zero confidence usually means a failed generation, which is worth retrying
+        if self.cache_size > 0 and result.confidence > 0.0:
+            self._response_cache[cache_key] = result
+            if len(self._response_cache) > self.cache_size:
+                self._response_cache.popitem(last=False)
+
+        return result
+
+    async def query_stream(self, question: str, top_k: int = 10) -> AsyncIterator[str]:
+        """Query the RAG system, yielding the answer text as it is generated"""
+        logger.info(f"Streaming query: '{question}' with top_k={top_k}")
+        
+        cached_result = self._response_cache.get(self._cache_key(question, top_k, False))
+        if cached_result is not None:
+            logger.info("Serving response from cache")
+            yield cached_result.answer
+            return
+        
+        # Let the generator start what doesn't depend on the documents, then retrieve them
+        prefetched = self.generator.prefetch(question)
+        try:
+            retrieval_results = await self._retrieve(question, top_k, with_metadata=False)
+            retrieved_docs = [rr.document for rr in retrieval_results]
+            
+            async for chunk in self.generator.generate_response_stream(question, retrieved_docs):
+                yield chunk
+        finally:
+            # Also runs when the client disconnects before generation picked up the prefetched work
+            self.generator.discard_prefetch(question, prefetched)
+
+    async def _retrieve(self, question: str, top_k: int, with_metadata: bool) -> List[RetrievalResult]:
+        """Retrieve documents, reusing the results of a near-duplicate question when possible"""
+        if self._similarity_cache is None:
+            return await self.retriever.retrieve(question, top_k=top_k, with_metadata=with_metadata)
+        
+        query_vector = await self.retriever.embed_query(question)
+        if query_vector is None:
+            return await self.retriever.retrieve(question, top_k=top_k, with_metadata=with_metadata)
+        
+        retrieval_results = self._similarity_cache.get(query_vector, top_k, with_metadata)
+        if retrieval_results is not None:
+            logger.info("Serving retrieval results of a similar cached query")
+            return retrieval_results
+        
+        # Fetch extra results so later similar questions asking for more documents still hit
+        k_prime = 2 * top_k
+        retrieval_results = await self.retriever.retrieve(question, top_k=k_prime, with_metadata=with_metadata)
+        self._similarity_cache.put(
+            self._normalize_question(question), query_vector, k_prime, with_metadata, retrieval_results
+        )
+        return retrieval_results[:top_k]
+    
+    def _cache_key(self, question: str, top_k: int, attach_documents: bool) -> tuple:
+        """Build the response cache key of a query"""
+        return (self._normalize_question(question), top_k, attach_documents)
+    
+    def _normalize_question(self, question: str) -> str:
+        """Normalize a question so trivially different spellings share a cache entry"""
+        return " ".join(question.lower().split())
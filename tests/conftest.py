@@ -2,7 +2,7 @@ import pytest
 from fastapi.testclient import TestClient
 from src.app import app
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
 def client():
     with TestClient(app) as c:
         yield c
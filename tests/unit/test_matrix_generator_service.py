@@ -0,0 +1,148 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, FunctionModel
+
+from src.services.implementations.matrix_generator_service import MatrixGeneratorService
+from src.schemas.models import Document, QueryDecomposition, QueryResult, SubQueryResponse
+
+
+class TestMatrixGeneratorService:
+    """Test class for MatrixGeneratorService"""
+
+    @pytest.fixture
+    def service(self):
+        """Create a generator service; its agents are only run through overridden models"""
+        return MatrixGeneratorService()
+
+    @pytest.fixture
+    def sample_documents(self):
+        """Create a list of sample documents for testing"""
+        return [
+            Document(id="doc1", page_content="NEO: Why do my eyes hurt?"),
+            Document(id="doc2", page_content="MORPHEUS: You've never used them before.")
+        ]
+
+    @pytest.mark.asyncio
+    async def test_generate_response_stream_yields_answer_deltas(self, service, sample_documents):
+        """Test the answer field is streamed as it grows inside the partial tool call arguments"""
+        args = json.dumps({
+            "answer": "Neo has never used his eyes.",
+            "confidence": 0.9,
+            "sources_used": ["doc1"],
+            "reasoning": "Stated by Morpheus."
+        })
+
+        async def stream_function(messages, info: AgentInfo):
+            # Split the arguments mid-string so every chunk is an incomplete JSON document
+            tool_name = info.output_tools[0].name
+            yield {0: DeltaToolCall(name=tool_name, json_args=args[:20])}
+            for start in range(20, len(args), 7):
+                yield {0: DeltaToolCall(json_args=args[start:start + 7])}
+
+        with service.response_agent.override(model=FunctionModel(stream_function=stream_function)):
+            chunks = [chunk async for chunk in service.generate_response_stream("Who is Neo?", sample_documents)]
+
+        assert len(chunks) > 1
+        assert "".join(chunks) == "Neo has never used his eyes."
+
+    def test_prune_subqueries_drops_duplicates_and_restatements(self, service):
+        """Test repeated subqueries and near copies of the query are dropped"""
+        query = "Describe Cypher's personality."
+        subqueries = [
+            "What does Cypher say to Neo?",
+            "  what does cypher SAY to neo?",
+            "describe cypher's personality?",
+            "How does Cypher betray the crew?"
+        ]
+
+        pruned = service._prune_subqueries(query, subqueries)
+
+        assert pruned == ["What does Cypher say to Neo?", "How does Cypher betray the crew?"]
+
+    def test_prune_subqueries_caps_at_max_subqueries(self, service):
+        """Test at most max_subqueries subqueries are kept, in their original order"""
+        service.max_subqueries = 2
+        subqueries = ["Who is Neo?", "Who is Trinity?", "Who is Morpheus?"]
+
+        pruned = service._prune_subqueries("Describe the Nebuchadnezzar crew.", subqueries)
+
+        assert pruned == ["Who is Neo?", "Who is Trinity?"]
+
+    def test_dedupe_and_truncate_drops_repeated_content(self, service):
+        """Test documents whose content only differs in whitespace are kept once"""
+        context = [
+            Document(id="doc1", page_content="Follow the white rabbit."),
+            Document(id="doc2", page_content="Follow  the white\nrabbit."),
+            Document(id="doc3", page_content="Knock, knock, Neo.")
+        ]
+
+        trimmed = service._dedupe_and_truncate(context)
+
+        assert [doc.id for doc in trimmed] == ["doc1", "doc3"]
+
+    def test_dedupe_and_truncate_respects_token_budget(self, service):
+        """Test the context is cut at the token budget but never emptied"""
+        service.max_context_tokens = 5
+        context = [
+            Document(id="doc1", page_content="a" * 15),
+            Document(id="doc2", page_content="b" * 15),
+            Document(id="doc3", page_content="c" * 15)
+        ]
+
+        assert [doc.id for doc in service._dedupe_and_truncate(context)] == ["doc1"]
+
+        # A first document over the budget on its own is still kept
+        service.max_context_tokens = 1
+        assert [doc.id for doc in service._dedupe_and_truncate(context)] == ["doc1"]
+
+    def test_lacks_support(self, service):
+        """Test synthesis is only skipped when no subquery reaches the minimum confidence"""
+        def response(confidence):
+            return SubQueryResponse(subquery="q", answer="a", confidence=confidence, sources_used=[])
+
+        assert service._lacks_support([])
+        assert service._lacks_support([response(0.0), response(0.05)])
+        assert not service._lacks_support([response(0.0), response(0.6)])
+
+    @pytest.mark.asyncio
+    async def test_complex_query_without_subqueries_returns_draft(self, service, sample_documents):
+        """Test a decomposition pruned down to nothing falls back to the draft answer"""
+        draft = QueryResult(query="q", answer="Draft answer", confidence=0.5, sources_used=["doc1"])
+        service._decompose_query = AsyncMock(return_value=QueryDecomposition(subqueries=[], reasoning="r"))
+        service._handle_simple_query = AsyncMock(return_value=draft)
+        service._synthesize_final_answer = AsyncMock()
+
+        result = await service._handle_complex_query("Describe Cypher's personality.", sample_documents)
+
+        assert result == draft
+        service._synthesize_final_answer.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_failed_decomposition_cancels_draft(self, service, sample_documents):
+        """Test the draft call is cancelled rather than left running when decomposition fails"""
+        draft_started = asyncio.Event()
+        draft_cancelled = False
+
+        async def decompose(query):
+            await draft_started.wait()
+            raise RuntimeError("decomposition failed")
+
+        async def draft(query, context, formatted_context):
+            nonlocal draft_cancelled
+            draft_started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                draft_cancelled = True
+                raise
+
+        service._decompose_query = decompose
+        service._handle_simple_query = draft
+
+        result = await service._handle_complex_query("Describe Cypher's personality.", sample_documents)
+        await asyncio.sleep(0)
+
+        assert "decomposition failed" in result.answer
+        assert draft_cancelled
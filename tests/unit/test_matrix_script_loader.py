@@ -0,0 +1,41 @@
+import os
+import pytest
+from unittest.mock import patch
+
+from kbac.loaders.matrix_script_loader import Document, MatrixScriptLoader
+
+
+class TestMatrixScriptLoader:
+    """Test class for MatrixScriptLoader"""
+
+    @pytest.fixture
+    def loader(self, tmp_path):
+        """Create a loader with a cache directory and a stand-in source file"""
+        source_path = tmp_path / "script.pdf"
+        source_path.write_bytes(b"%PDF-1.4")
+        return MatrixScriptLoader(source_path=str(source_path), cache_dir=str(tmp_path / "cache"))
+
+    @pytest.fixture
+    def sample_documents(self):
+        """Create a list of parsed documents"""
+        return [
+            Document(text="Follow the white rabbit.", metadata={"text_type": "dialog", "character": "TRINITY"}),
+            Document(text="Neo sits at his computer.", metadata={"text_type": "scene_description"})
+        ]
+
+    @pytest.mark.parametrize("cache_content", ["not json", '[["text only"]]', "[1, 2]", '[[1, {}]]'])
+    def test_load_with_unusable_cache_rebuilds_it(self, loader, sample_documents, cache_content):
+        """Test an unreadable cache file is reported, parsed around and overwritten"""
+        cache_path = loader._get_cache_path()
+        os.makedirs(loader.cache_dir)
+        with open(cache_path, "w", encoding="utf-8") as cache_file:
+            cache_file.write(cache_content)
+
+        with patch.object(MatrixScriptLoader, "_load", return_value=sample_documents) as mock_load:
+            with pytest.warns(UserWarning, match="could not read loader cache"):
+                documents = loader.load()
+
+            # Verify the documents were parsed again and the cache repaired
+            assert documents == sample_documents
+            assert loader.load() == sample_documents
+            mock_load.assert_called_once()
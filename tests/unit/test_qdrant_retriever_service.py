@@ -1,15 +1,9 @@
+import asyncio
 import pytest
-from unittest.mock import MagicMock, patch
-import sys
+from unittest.mock import AsyncMock, MagicMock, patch
 
-# Path patching to make the mocks work correctly
-with patch.dict(sys.modules, {
-    'qdrant_client': MagicMock(),
-    'langchain_openai': MagicMock(),
-    'langchain_qdrant': MagicMock()
-}):
-    from src.services.implementations.qdrant_retriever_service import QdrantRetrieverService
-from src.schemas.models import Document
+from src.services.implementations.qdrant_retriever_service import QdrantRetrieverService
+from src.schemas.models import Document, DocumentBatch
 
 
 class TestQdrantRetrieverService:
@@ -23,8 +17,18 @@ class TestQdrantRetrieverService:
         config.embedding_dims = 1536
         config.embedding_model = "text-embedding-3-small"
         config.qdrant_use_memory = True  # Use in-memory storage for tests
+        config.qdrant_path = None
+        config.embedding_cache_path = None
+        config.qdrant_quantization = None
+        config.qdrant_hnsw_ef = 64
+        config.qdrant_indexed_only = False
+        config.qdrant_hnsw_m = 32
+        config.qdrant_hnsw_ef_construct = 256
+        config.qdrant_max_indexing_threads = 2
         config.qdrant_host = "localhost"
         config.qdrant_port = 6333
+        config.qdrant_grpc_port = 6334
+        config.qdrant_prefer_grpc = True
         return config
 
     @pytest.fixture
@@ -69,37 +73,82 @@ class TestQdrantRetrieverService:
             
             # Verify client initialization with memory
             mock_qdrant_client.assert_called_once_with(":memory:")
-        assert service.vectorstore is None
+        assert service.async_client is None
 
     def test_init_with_remote_client(self, mock_config):
         """Test initialization with remote client"""
         mock_config.qdrant_use_memory = False
         
-        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client:
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.AsyncQdrantClient') as mock_async_qdrant_client:
             mock_qdrant_client.return_value.collection_exists.return_value = False
             
             service = QdrantRetrieverService(mock_config)
             
-            # Verify client initialization with host and port
+            # Verify client initialization with host, ports and the gRPC transport
             mock_qdrant_client.assert_called_once_with(
                 host=mock_config.qdrant_host,
-                port=mock_config.qdrant_port
+                port=mock_config.qdrant_port,
+                grpc_port=mock_config.qdrant_grpc_port,
+                prefer_grpc=True
+            )
+            mock_async_qdrant_client.assert_called_once_with(
+                host=mock_config.qdrant_host,
+                port=mock_config.qdrant_port,
+                grpc_port=mock_config.qdrant_grpc_port,
+                prefer_grpc=True
             )
-            assert service.vectorstore is None
 
-    def test_init_with_existing_collection(self, mock_config):
-        """Test initialization with existing collection"""
+    def test_init_with_injected_clients(self, mock_config):
+        """Test services built with shared clients don't open connections of their own"""
+        client, async_client = MagicMock(), MagicMock()
+        
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.AsyncQdrantClient') as mock_async_qdrant_client:
+            
+            first = QdrantRetrieverService(mock_config, client, async_client)
+            second = QdrantRetrieverService(mock_config, client, async_client)
+            
+            # Verify both services reuse the given clients
+            mock_qdrant_client.assert_not_called()
+            mock_async_qdrant_client.assert_not_called()
+            assert first.client is second.client is client
+            assert first.async_client is second.async_client is async_client
+
+    def test_init_with_quantization(self, mock_config, sample_documents):
+        """Test scalar quantization is configured on the collection and used when searching"""
+        mock_config.qdrant_quantization = "scalar"
+        
         with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
-             patch('src.services.implementations.qdrant_retriever_service.QdrantVectorStore') as mock_vector_store:
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_embeddings.return_value.embed_documents.return_value = [[0.1, 0.2], [0.3, 0.4]]
             
-            # Setup mock to indicate collection exists
+            service = QdrantRetrieverService(mock_config)
+            service.index_documents(sample_documents)
+            
+            # Verify the collection was created with int8 scalar quantization
+            quantization_config = mock_qdrant_client.return_value.create_collection.call_args.kwargs["quantization_config"]
+            assert quantization_config.scalar.type == "int8"
+            
+            # Verify searches rescore the quantized candidates
+            assert service._search_params().quantization.rescore is True
+
+    def test_init_with_existing_collection(
+        self, mock_config, mock_populated_collection_info
+    ):
+        """Test initialization with existing collection"""
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client:
+            
+            # Setup mock to indicate a populated collection exists
             mock_qdrant_client.return_value.collection_exists.return_value = True
+            mock_qdrant_client.return_value.get_collection.return_value = mock_populated_collection_info
             
             service = QdrantRetrieverService(mock_config)
             
-            # Verify vector store initialization
-            mock_vector_store.assert_called_once()
-            assert service.vectorstore is not None
+            # Verify the existing collection is used as is
+            assert service.is_initialized()
+            mock_qdrant_client.return_value.create_collection.assert_not_called()
 
     def test_is_initialized_no_collection(self, mock_config):
         """Test is_initialized when collection doesn't exist"""
@@ -125,71 +174,234 @@ class TestQdrantRetrieverService:
             
             assert service.is_initialized()
 
+    def test_is_initialized_is_cached(
+        self, mock_config, mock_populated_collection_info
+    ):
+        """Test is_initialized only queries Qdrant until the collection is found populated"""
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client:
+            mock_qdrant_client.return_value.collection_exists.return_value = True
+            mock_qdrant_client.return_value.get_collection.return_value = mock_populated_collection_info
+            
+            service = QdrantRetrieverService(mock_config)
+            
+            assert service.is_initialized()
+            assert service.is_initialized()
+            
+            # Verify the collection info was only fetched once
+            mock_qdrant_client.return_value.get_collection.assert_called_once()
+
+    def test_is_initialized_after_indexing(self, mock_config, sample_documents):
+        """Test a service that just indexed documents knows it is initialized without asking Qdrant"""
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_embeddings.return_value.embed_documents.return_value = [[0.1, 0.2], [0.3, 0.4]]
+            
+            service = QdrantRetrieverService(mock_config)
+            service.index_documents(sample_documents)
+            mock_qdrant_client.return_value.reset_mock()
+            
+            assert service.is_initialized()
+            
+            # Verify neither round trip of the check was made
+            mock_qdrant_client.return_value.collection_exists.assert_not_called()
+            mock_qdrant_client.return_value.get_collection.assert_not_called()
+
     def test_index_documents_new_collection(
         self, mock_config, sample_documents
     ):
         """Test indexing documents in a new collection"""
         with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
-             patch('src.services.implementations.qdrant_retriever_service.QdrantVectorStore') as mock_vector_store:
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
             
             # Setup mocks
             mock_qdrant_client.return_value.collection_exists.return_value = False
-            mock_vector_store_instance = MagicMock()
-            mock_vector_store.return_value = mock_vector_store_instance
+            mock_embeddings.return_value.embed_documents.return_value = [[0.1, 0.2], [0.3, 0.4]]
             
             service = QdrantRetrieverService(mock_config)
             
             # Reset mock to track calls after initialization
             mock_qdrant_client.reset_mock()
             
-            # Setup the vectorstore mock
-            service._init_vector_store = MagicMock()
-            service.vectorstore = mock_vector_store_instance
-            
             # Index documents
             service.index_documents(sample_documents)
             
-            # Verify collection was created
+            # Verify collection was created with indexing disabled
             mock_qdrant_client.return_value.create_collection.assert_called_once()
+            create_kwargs = mock_qdrant_client.return_value.create_collection.call_args.kwargs
+            assert create_kwargs["optimizers_config"].indexing_threshold == 0
+            
+            # Verify the configured HNSW graph settings were applied
+            assert create_kwargs["hnsw_config"].m == 32
+            assert create_kwargs["hnsw_config"].ef_construct == 256
+            assert create_kwargs["hnsw_config"].max_indexing_threads > 0
+            
+            # Verify documents were embedded once and bulk uploaded
+            mock_embeddings.return_value.embed_documents.assert_called_once_with(
+                [doc.page_content for doc in sample_documents]
+            )
+            mock_qdrant_client.return_value.upload_points.assert_called_once()
+            upload_kwargs = mock_qdrant_client.return_value.upload_points.call_args.kwargs
+            points = upload_kwargs["points"]
+            assert [point.id for point in points] == [doc.id for doc in sample_documents]
+            assert [point.vector for point in points] == [[0.1, 0.2], [0.3, 0.4]]
+            assert points[0].payload == {
+                "page_content": sample_documents[0].page_content,
+                "metadata": sample_documents[0].metadata
+            }
+            assert upload_kwargs["batch_size"] > 0
+            assert upload_kwargs["parallel"] >= 1
             
-            # Verify documents were added
-            mock_vector_store_instance.add_documents.assert_called_once_with(sample_documents)
+            # Verify indexing was re-enabled afterwards
+            mock_qdrant_client.return_value.update_collection.assert_called_once()
+            update_kwargs = mock_qdrant_client.return_value.update_collection.call_args.kwargs
+            assert update_kwargs["optimizers_config"].indexing_threshold > 0
   
-    def test_retrieve_success(
+    def test_index_documents_accepts_document_batch(self, mock_config, sample_documents):
+        """Test indexing a column-wise DocumentBatch uploads the same points as a document list"""
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_embeddings.return_value.embed_documents.return_value = [[0.1, 0.2], [0.3, 0.4]]
+            
+            service = QdrantRetrieverService(mock_config)
+            service.index_documents(sample_documents)
+            service.index_documents(DocumentBatch.from_documents(sample_documents))
+            
+            # Verify both forms produced identical points
+            from_list, from_batch = [
+                [(point.id, point.vector, point.payload) for point in upload.kwargs["points"]]
+                for upload in mock_qdrant_client.return_value.upload_points.call_args_list
+            ]
+            assert from_batch == from_list
+            assert [point_id for point_id, _, _ in from_batch] == [doc.id for doc in sample_documents]
+
+    def test_index_documents_reuses_cached_embeddings(
+        self, mock_config, sample_documents, tmp_path
+    ):
+        """Test re-indexing unchanged documents takes their vectors from the embedding cache"""
+        mock_config.embedding_cache_path = str(tmp_path / "embeddings.sqlite3")
+        
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            
+            # Setup mocks
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_embeddings.return_value.embed_documents.return_value = [[0.5, 0.25], [0.125, 1.0]]
+            
+            # Index the same documents twice, as two separate processes would
+            QdrantRetrieverService(mock_config).index_documents(sample_documents)
+            QdrantRetrieverService(mock_config).index_documents(sample_documents)
+            
+            # Verify the documents were only embedded once
+            mock_embeddings.return_value.embed_documents.assert_called_once()
+            
+            # Verify both runs uploaded the same vectors
+            uploads = mock_qdrant_client.return_value.upload_points.call_args_list
+            assert len(uploads) == 2
+            assert [point.vector for point in uploads[1].kwargs["points"]] == [[0.5, 0.25], [0.125, 1.0]]
+
+    @pytest.mark.asyncio
+    async def test_aindex_documents_concurrent_upserts(
+        self, mock_config, sample_documents
+    ):
+        """Test async indexing upserts every batch through the async client"""
+        mock_config.qdrant_use_memory = False
+        
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.AsyncQdrantClient') as mock_async_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            
+            # Setup mocks
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_async_qdrant_client.return_value.upsert = AsyncMock()
+            mock_async_qdrant_client.return_value.update_collection = AsyncMock()
+            mock_embeddings.return_value.aembed_documents = AsyncMock(return_value=[[0.1, 0.2], [0.3, 0.4]])
+            
+            service = QdrantRetrieverService(mock_config)
+            
+            # Index one document per batch
+            await service.aindex_documents(sample_documents, batch_size=1)
+            
+            # Verify one upsert per batch and indexing re-enabled afterwards
+            assert mock_async_qdrant_client.return_value.upsert.await_count == len(sample_documents)
+            upserted_ids = [
+                call.kwargs["points"][0].id
+                for call in mock_async_qdrant_client.return_value.upsert.await_args_list
+            ]
+            assert upserted_ids == [doc.id for doc in sample_documents]
+            mock_qdrant_client.return_value.create_collection.assert_called_once()
+            mock_async_qdrant_client.return_value.update_collection.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_aindex_documents_overlaps_embedding_and_upserts(
+        self, mock_config, sample_documents
+    ):
+        """Test async indexing upserts embedded chunks while later chunks are still being embedded"""
+        mock_config.qdrant_use_memory = False
+        events = []
+        
+        async def embed(texts):
+            events.append(("embed started", texts[0]))
+            await asyncio.sleep(0.01)
+            events.append(("embed finished", texts[0]))
+            return [[0.1, 0.2] for _ in texts]
+        
+        async def upsert(collection_name, points, wait):
+            events.append(("upsert", points[0].payload["page_content"]))
+        
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.AsyncQdrantClient') as mock_async_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_async_qdrant_client.return_value.upsert = AsyncMock(side_effect=upsert)
+            mock_async_qdrant_client.return_value.update_collection = AsyncMock()
+            mock_embeddings.return_value.aembed_documents = AsyncMock(side_effect=embed)
+            
+            service = QdrantRetrieverService(mock_config)
+            
+            # Embed one document per request
+            await service.aindex_documents(sample_documents, embed_batch_size=1)
+            
+            # Verify the first chunk was upserted before the second finished embedding
+            first, second = [doc.page_content for doc in sample_documents]
+            assert events.index(("upsert", first)) < events.index(("embed finished", second))
+            assert ("upsert", second) in events
+            mock_async_qdrant_client.return_value.update_collection.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_retrieve_success(
         self, mock_config
     ):
         """Test successful retrieval"""
         with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
-             patch('src.services.implementations.qdrant_retriever_service.QdrantVectorStore') as mock_vector_store:
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
             
             # Setup mocks
-            mock_qdrant_client.return_value.collection_exists.return_value = True
-            mock_qdrant_client.return_value.get_collection.return_value.points_count = 10
-            
-            # Create a mock document for the search result
-            mock_doc = MagicMock()
-            mock_doc.page_content = "Test content"
-            mock_doc.metadata = {"_id": "doc1", "source": "test"}
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_embeddings.return_value.aembed_documents = AsyncMock(return_value=[[0.1, 0.2]])
             
-            # Setup the search results
-            mock_vector_store_instance = MagicMock()
-            mock_vector_store.return_value = mock_vector_store_instance
-            mock_vector_store_instance.similarity_search_with_score.return_value = [(mock_doc, 0.95)]
+            # Create a mock point for the search result
+            mock_point = MagicMock()
+            mock_point.id = "doc1"
+            mock_point.score = 0.95
+            mock_point.payload = {"page_content": "Test content", "metadata": {"source": "test"}}
+            mock_response = MagicMock()
+            mock_response.points = [mock_point]
+            mock_qdrant_client.return_value.query_batch_points.return_value = [mock_response]
             
             service = QdrantRetrieverService(mock_config)
             
             # Mock initialization status
-            service.is_initialized = MagicMock(return_value=True)
-            service.vectorstore = mock_vector_store_instance
+            service._is_initialized_async = AsyncMock(return_value=True)
             
             # Perform retrieval
-            results = service.retrieve("test query", top_k=3)
+            results = await service.retrieve("test query", top_k=3)
             
-            # Verify the search was performed
-            mock_vector_store_instance.similarity_search_with_score.assert_called_once_with(
-                query="test query",
-                k=3
-            )
+            # Verify the search was performed as a batch of one
+            mock_embeddings.return_value.aembed_documents.assert_awaited_once_with(["test query"])
+            mock_qdrant_client.return_value.query_batch_points.assert_called_once()
+            assert mock_qdrant_client.return_value.query_batch_points.call_args.kwargs["collection_name"] == mock_config.collection_name
             
             # Verify the results
             assert len(results) == 1
@@ -197,3 +409,130 @@ class TestQdrantRetrieverService:
             assert results[0].rank == 1
             assert results[0].document.id == "doc1"
             assert results[0].document.page_content == "Test content"
+            assert results[0].document.metadata == {"source": "test"}
+
+    @pytest.mark.asyncio
+    async def test_retrieve_uses_configured_search_params(self, mock_config):
+        """Test searches pass the configured HNSW ef and indexed_only settings"""
+        mock_config.qdrant_hnsw_ef = 32
+        mock_config.qdrant_indexed_only = True
+        
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            mock_embeddings.return_value.aembed_documents = AsyncMock(return_value=[[0.1, 0.2]])
+            mock_qdrant_client.return_value.query_batch_points.return_value = [MagicMock(points=[])]
+            
+            service = QdrantRetrieverService(mock_config)
+            service._is_initialized_async = AsyncMock(return_value=True)
+            
+            await service.retrieve("test query", top_k=3)
+            
+            request = mock_qdrant_client.return_value.query_batch_points.call_args.kwargs["requests"][0]
+            assert request.params.hnsw_ef == 32
+            assert request.params.indexed_only is True
+            assert request.params.exact is False
+
+    @pytest.mark.asyncio
+    async def test_retrieve_round_trips_metadata(self, mock_config):
+        """Test a retrieved document matches the indexed one, metadata included"""
+        document = Document(
+            id="12345678-1234-5678-1234-567812345678",
+            page_content="Wake up, Neo...",
+            metadata={
+                "text_type": "dialog",
+                "character": "TRINITY",
+                "location": "INT. NEO'S APARTMENT – NIGHT",
+                "scene_description_id": None,
+                "page_number": 7,
+                "tags": ["matrix", {"nested": True}]
+            }
+        )
+        
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_embeddings.return_value.embed_documents.return_value = [[0.1, 0.2]]
+            mock_embeddings.return_value.aembed_documents = AsyncMock(return_value=[[0.1, 0.2]])
+            
+            service = QdrantRetrieverService(mock_config)
+            service.index_documents([document])
+            
+            # Serve the uploaded point back as the search hit
+            uploaded_point = mock_qdrant_client.return_value.upload_points.call_args.kwargs["points"][0]
+            mock_response = MagicMock()
+            mock_response.points = [MagicMock(id=uploaded_point.id, score=0.9, payload=uploaded_point.payload)]
+            mock_qdrant_client.return_value.query_batch_points.return_value = [mock_response]
+            service._is_initialized_async = AsyncMock(return_value=True)
+            
+            results = await service.retrieve("test query", top_k=1)
+            
+            assert results[0].document == document
+
+    @pytest.mark.asyncio
+    async def test_retrieve_cached_query(
+        self, mock_config
+    ):
+        """Test that repeating a query reuses its cached embedding"""
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            
+            # Setup mocks
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_embeddings.return_value.aembed_documents = AsyncMock(return_value=[[0.1, 0.2]])
+            mock_response = MagicMock()
+            mock_response.points = []
+            mock_qdrant_client.return_value.query_batch_points.return_value = [mock_response]
+            
+            service = QdrantRetrieverService(mock_config)
+            service._is_initialized_async = AsyncMock(return_value=True)
+            
+            # Perform the same retrieval twice
+            await service.retrieve("test query", top_k=3)
+            await service.retrieve("test query", top_k=3)
+            
+            # Verify the query was embedded once but searched twice
+            mock_embeddings.return_value.aembed_documents.assert_awaited_once_with(["test query"])
+            assert mock_qdrant_client.return_value.query_batch_points.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_retrieve_batch_success(
+        self, mock_config
+    ):
+        """Test batched retrieval with a single embedding call and a single search"""
+        with patch('src.services.implementations.qdrant_retriever_service.QdrantClient') as mock_qdrant_client, \
+             patch('src.services.implementations.qdrant_retriever_service.OpenAIEmbeddings') as mock_embeddings:
+            
+            # Setup mocks
+            mock_qdrant_client.return_value.collection_exists.return_value = False
+            mock_embeddings.return_value.aembed_documents = AsyncMock(return_value=[[0.1, 0.2], [0.3, 0.4]])
+            
+            # Create one search response per query
+            mock_point = MagicMock()
+            mock_point.id = "12345678-1234-5678-1234-567812345678"
+            mock_point.score = 0.9
+            mock_point.payload = {"page_content": "Test content", "metadata": {"source": "test"}}
+            first_response = MagicMock()
+            first_response.points = [mock_point]
+            second_response = MagicMock()
+            second_response.points = []
+            mock_qdrant_client.return_value.query_batch_points.return_value = [first_response, second_response]
+            
+            service = QdrantRetrieverService(mock_config)
+            service._is_initialized_async = AsyncMock(return_value=True)
+            
+            # Perform batched retrieval
+            results = await service.retrieve_batch(["first query", "second query"], top_k=3)
+            
+            # Verify the queries were embedded and searched together
+            mock_embeddings.return_value.aembed_documents.assert_awaited_once_with(["first query", "second query"])
+            mock_qdrant_client.return_value.query_batch_points.assert_called_once()
+            
+            # Verify the results
+            assert len(results) == 2
+            assert len(results[0]) == 1
+            assert results[0][0].rank == 1
+            assert results[0][0].score == 0.9
+            assert results[0][0].document.id == "12345678-1234-5678-1234-567812345678"
+            assert results[0][0].document.page_content == "Test content"
+            assert results[0][0].document.metadata == {"source": "test"}
+            assert results[1] == []
@@ -1,7 +1,10 @@
+import asyncio
+import threading
 import pytest
 from unittest.mock import MagicMock, AsyncMock
 from src.services.rag_service import RAGService
-from src.schemas.models import Document, QueryResult, RetrievalResult
+from src.services.implementations.matrix_generator_service import MatrixGeneratorService
+from src.schemas.models import Document, QueryDecomposition, QueryResult, RetrievalResult
 
 
 class TestRAGService:
@@ -52,7 +55,7 @@ class TestRAGService:
                 rank=2
             )
         ]
-        retriever.retrieve.return_value = retrieval_results
+        retriever.retrieve = AsyncMock(return_value=retrieval_results)
         return retriever
 
     @pytest.fixture
@@ -118,6 +121,29 @@ class TestRAGService:
         mock_loader.load_documents.assert_called_once()
         mock_retriever.index_documents.assert_called_once_with(sample_documents)
 
+    @pytest.mark.asyncio
+    async def test_aindex_not_initialized(self, mock_loader, mock_retriever, mock_generator, sample_documents):
+        """Test async indexing loads documents off the event loop and indexes them"""
+        mock_retriever.is_initialized.return_value = False
+        mock_retriever.aindex_documents = AsyncMock()
+        
+        event_loop_thread = threading.current_thread()
+        loader_threads = []
+        mock_loader.load_documents.side_effect = lambda: loader_threads.append(threading.current_thread()) or sample_documents
+        
+        service = RAGService(
+            loader=mock_loader,
+            retriever=mock_retriever,
+            generator=mock_generator
+        )
+        
+        await service.aindex()
+        
+        # Verify documents were loaded in a worker thread and indexed asynchronously
+        assert loader_threads and loader_threads[0] is not event_loop_thread
+        mock_retriever.aindex_documents.assert_awaited_once_with(sample_documents)
+        mock_retriever.index_documents.assert_not_called()
+
     @pytest.mark.asyncio
     async def test_query_without_documents(
         self, mock_loader, mock_retriever_with_docs, mock_generator, sample_documents
@@ -132,8 +158,8 @@ class TestRAGService:
         # Call query method
         result = await service.query("test query", top_k=5, attach_documents=False)
         
-        # Verify retriever was called
-        mock_retriever_with_docs.retrieve.assert_called_once_with("test query", top_k=5)
+        # Verify retriever was called without fetching metadata nobody will see
+        mock_retriever_with_docs.retrieve.assert_called_once_with("test query", top_k=5, with_metadata=False)
         
         # Verify generator was called with the retrieved documents
         mock_generator.generate_response.assert_awaited_once_with(
@@ -162,7 +188,7 @@ class TestRAGService:
         result = await service.query("test query", top_k=5, attach_documents=True)
         
         # Verify retriever was called
-        mock_retriever_with_docs.retrieve.assert_called_once_with("test query", top_k=5)
+        mock_retriever_with_docs.retrieve.assert_called_once_with("test query", top_k=5, with_metadata=True)
         
         # Verify generator was called with the retrieved documents
         mock_generator.generate_response.assert_awaited_once_with(
@@ -176,3 +202,160 @@ class TestRAGService:
         assert result.confidence == 0.92
         assert result.retrieved_documents is not None  # Documents are attached
         assert len(result.retrieved_documents) == 2
+
+    @pytest.mark.asyncio
+    async def test_query_repeated_question_uses_cache(
+        self, mock_loader, mock_retriever_with_docs, mock_generator
+    ):
+        """Test that a repeated question is answered from the response cache"""
+        service = RAGService(
+            loader=mock_loader,
+            retriever=mock_retriever_with_docs,
+            generator=mock_generator
+        )
+        
+        first = await service.query("test query", top_k=5)
+        second = await service.query("  Test   QUERY ", top_k=5)
+        
+        # Verify the pipeline ran only once
+        mock_retriever_with_docs.retrieve.assert_called_once()
+        mock_generator.generate_response.assert_awaited_once()
+        assert second == first
+        assert second is not first
+        
+        # A different top_k is a different cache entry
+        await service.query("test query", top_k=3)
+        assert mock_retriever_with_docs.retrieve.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_query_similar_question_reuses_retrieval(
+        self, mock_loader, mock_retriever_with_docs, mock_generator
+    ):
+        """Test that a near-duplicate question reuses the cached retrieval results"""
+        mock_retriever_with_docs.embed_query = AsyncMock(side_effect=[[1.0, 0.0], [0.99, 0.01]])
+        service = RAGService(
+            loader=mock_loader,
+            retriever=mock_retriever_with_docs,
+            generator=mock_generator,
+            similarity_cache_size=8
+        )
+        
+        await service.query("Who is Neo?", top_k=1)
+        result = await service.query("Who's Neo?", top_k=1)
+        
+        # Verify the second question bypassed the retriever
+        mock_retriever_with_docs.retrieve.assert_awaited_once_with("Who is Neo?", top_k=2, with_metadata=False)
+        assert mock_generator.generate_response.await_count == 2
+        assert mock_generator.generate_response.await_args.args[1] == [mock_retriever_with_docs.retrieve.return_value[0].document]
+
+    @pytest.mark.asyncio
+    async def test_query_prefetches_generation_during_retrieval(
+        self, mock_loader, mock_retriever_with_docs, mock_generator
+    ):
+        """Test that the generator starts working on the question before retrieval completes"""
+        async def retrieve(question, top_k, with_metadata):
+            # Verify the generator was already told about the question
+            mock_generator.prefetch.assert_called_once_with(question)
+            return []
+        
+        mock_retriever_with_docs.retrieve = AsyncMock(side_effect=retrieve)
+        service = RAGService(
+            loader=mock_loader,
+            retriever=mock_retriever_with_docs,
+            generator=mock_generator
+        )
+        
+        await service.query("test query")
+        
+        mock_retriever_with_docs.retrieve.assert_awaited_once()
+        mock_generator.generate_response.assert_awaited_once_with("test query", [])
+
+    @pytest.mark.asyncio
+    async def test_query_concurrent_identical_questions_share_pipeline(
+        self, mock_loader, mock_retriever_with_docs, mock_generator
+    ):
+        """Test that identical questions in flight at the same time run the pipeline once"""
+        service = RAGService(
+            loader=mock_loader,
+            retriever=mock_retriever_with_docs,
+            generator=mock_generator,
+            cache_size=0
+        )
+        
+        first, second = await asyncio.gather(service.query("q"), service.query("q"))
+        
+        # Verify the pipeline ran once and each caller got its own copy
+        mock_retriever_with_docs.retrieve.assert_awaited_once()
+        mock_generator.generate_response.assert_awaited_once()
+        assert first == second
+        assert first is not second
+
+    @pytest.mark.asyncio
+    async def test_query_failed_retrieval_discards_prefetch(self, mock_loader, mock_retriever_with_docs):
+        """Test that prefetched generation work is cancelled when retrieval fails"""
+        generator = MatrixGeneratorService()
+        decomposition_started = asyncio.Event()
+        
+        async def decompose(query):
+            decomposition_started.set()
+            await asyncio.sleep(10)
+        
+        async def retrieve(question, top_k, with_metadata):
+            await decomposition_started.wait()
+            raise ValueError("No documents have been indexed yet. Call index_documents first.")
+        
+        generator._decompose_query = decompose
+        mock_retriever_with_docs.retrieve = AsyncMock(side_effect=retrieve)
+        service = RAGService(
+            loader=mock_loader,
+            retriever=mock_retriever_with_docs,
+            generator=generator
+        )
+        
+        with pytest.raises(ValueError):
+            await service.query("Describe Cypher's personality.")
+        
+        # Verify the decomposition was dropped and cancelled
+        assert generator._prefetched_decompositions == {}
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.sleep(0)
+        assert all(task.done() for task in pending)
+
+    @pytest.mark.asyncio
+    async def test_overlapping_queries_share_prefetched_decomposition(self, mock_loader, mock_retriever_with_docs):
+        """Test that overlapping runs of one question decompose it once and release it when both finish"""
+        generator = MatrixGeneratorService()
+        question = "Describe Cypher's personality."
+        draft = QueryResult(query=question, answer="Draft answer", confidence=0.5, sources_used=[])
+        both_retrieving = asyncio.Event()
+        retrieving = 0
+        
+        async def retrieve(question, top_k, with_metadata):
+            nonlocal retrieving
+            retrieving += 1
+            if retrieving == 2:
+                both_retrieving.set()
+            await both_retrieving.wait()
+            return []
+        
+        generator._decompose_query = AsyncMock(return_value=QueryDecomposition(subqueries=[], reasoning="r"))
+        generator._handle_simple_query = AsyncMock(return_value=draft)
+        mock_retriever_with_docs.retrieve = AsyncMock(side_effect=retrieve)
+        service = RAGService(
+            loader=mock_loader,
+            retriever=mock_retriever_with_docs,
+            generator=generator,
+            cache_size=0
+        )
+        
+        # Attaching documents keeps the runs out of each other's single-flight key
+        first, second = await asyncio.gather(
+            service.query(question),
+            service.query(question, attach_documents=True)
+        )
+        
+        # Verify the decomposition started once and was released by the last run
+        generator._decompose_query.assert_awaited_once_with(question)
+        assert first.answer == second.answer == "Draft answer"
+        assert generator._prefetched_decompositions == {}
+        assert not generator._prefetch_runs